@@ -0,0 +1,375 @@
+"""Broadcast throughput benchmark against the fake Bot API
+
+Drives the real send_scheduled_message_auto, send_first_message and
+delete_latest_command handlers from main.py against fake_bot_api.py and
+reports, per scenario, API messages per second, p50/p99 latency of each
+send, peak RSS and event-loop lag:
+
+    python broadcast_benchmark.py --sizes 1k,10k --contents text,photo,group
+    python broadcast_benchmark.py --sizes 1k,10k,100k,1m --json results.json
+
+The fake server runs in its own process so it doesn't compete with the bot
+for the event loop. Bot state files are written to a temporary directory.
+By default the bot's rate limits are lifted (--rate 0) so the numbers show
+the fan-out's own overhead; pass --rate 30 to measure with production pacing.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_CHANNELS = (-1001000000001, -1001000000002)
+FIRST_SUBSCRIBER_ID = 10**6
+GROUP_SIZE = 10
+MESSAGE_ENDPOINTS = ("send", "copy", "forward", "delete")
+ENTRYPOINTS = ("auto", "send", "delete")
+CONTENTS = ("text", "photo", "group")
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    for suffix, factor in (("k", 10**3), ("m", 10**6)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is the peak so far, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopMonitor:
+    """Samples event-loop lag and RSS while a scenario runs"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.lags = []
+        self.peak_rss = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started - self.interval)
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def start(self):
+        self.lags = []
+        self.peak_rss = current_rss()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def start_fake_api(args):
+    """Launch fake_bot_api.py on a free port and wait until it answers"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable,
+        os.path.join(REPO_DIR, "fake_bot_api.py"), "--port",
+        str(port), "--latency",
+        str(args.latency), "--jitter",
+        str(args.jitter), "--flood-rate",
+        str(args.flood_rate), "--blocked-rate",
+        str(args.blocked_rate)
+    ],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/stats", timeout=0.5)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Fake Bot API did not start")
+
+
+def build_application(bot_main, api_url, args):
+    from telegram.ext import Application
+    from telegram.request import HTTPXRequest
+
+    class TimingRequest(HTTPXRequest):
+        """HTTPXRequest that times every message-sending Bot API call"""
+
+        def __init__(self, *request_args, **request_kwargs):
+            super().__init__(*request_args, **request_kwargs)
+            self.latencies = []
+            self.sent = 0
+
+        async def do_request(self, url, method, request_data=None, *rest,
+                             **kwargs):
+            endpoint = url.rsplit("/", 1)[-1]
+            if not endpoint.startswith(MESSAGE_ENDPOINTS):
+                return await super().do_request(url, method, request_data,
+                                                *rest, **kwargs)
+            started = time.perf_counter()
+            code, payload = await super().do_request(url, method,
+                                                     request_data, *rest,
+                                                     **kwargs)
+            self.latencies.append(time.perf_counter() - started)
+            if code == 200:
+                self.sent += 1
+            return code, payload
+
+    request = TimingRequest(connection_pool_size=args.pool_size,
+                            read_timeout=30,
+                            write_timeout=30,
+                            pool_timeout=30)
+    limiter = bot_main.FloodControlLimiter(bot_main.global_rate_limiter,
+                                           bot_main.broadcast_controller)
+    if args.chat_interval is not None:
+        limiter.private_limiter.interval = args.chat_interval
+        limiter.group_limiter.interval = args.chat_interval
+    application = Application.builder().token("123456:bench").base_url(
+        f"{api_url}/bot").request(request).rate_limiter(limiter).build()
+    return application, request
+
+
+def make_message(bot_main, content):
+    message = bot_main.ScheduledMessage()
+    if content == "text":
+        message.set_text("Benchmark broadcast 📣 " + "lorem ipsum " * 20)
+    elif content == "photo":
+        message.add_media("bench-photo-0", "photo", "Benchmark photo caption")
+    else:
+        message.media_group_id = "bench-group"
+        for n in range(GROUP_SIZE):
+            message.add_media(f"bench-photo-{n}", "photo",
+                              "Benchmark album caption" if n == 0 else None)
+    return message
+
+
+def reset_state(bot_main, args, size):
+    bot_main.subscribers.clear()
+    bot_main.subscribers.update(
+        range(FIRST_SUBSCRIBER_ID, FIRST_SUBSCRIBER_ID + size))
+    # The admin is a subscriber too, so the handlers don't persist a
+    # newly added subscriber in the middle of a measurement
+    bot_main.subscribers.add(bot_main.ADMIN_IDS[0])
+    bot_main.target_channels.clear()
+    bot_main.target_channels.update(BENCH_CHANNELS)
+    bot_main.failed_subscribers.clear()
+    bot_main.scheduled_messages.clear()
+    bot_main.broadcast_journal.records.clear()
+    bot_main.chat_cache.invalidate()
+    bot_main.auto_scheduling_active = False
+
+    rate = args.rate or 10**6
+    bot_main.global_rate_limiter.rate = rate
+    bot_main.broadcast_controller.max_rate = rate
+    bot_main.broadcast_controller.max_concurrency = args.concurrency
+    bot_main.broadcast_controller.limit = float(args.concurrency)
+
+
+async def seed_sent_post(bot_main, application, message, size):
+    """Record a sent post for delete_latest_command to take back"""
+    payload = message.payload()
+    channel_message_ids = []
+    for channel_id in BENCH_CHANNELS:
+        posted = await payload.send_to_channel(application.bot, channel_id)
+        channel_message_ids.extend(item.message_id for item in posted)
+    per_subscriber = len(payload.media_group) + 1 if payload.media_group else 1
+    subscriber_ids = list(
+        range(FIRST_SUBSCRIBER_ID, FIRST_SUBSCRIBER_ID + size))
+    await bot_main.save_sent_posts_tracking([{
+        "channels": list(BENCH_CHANNELS),
+        "message_ids": channel_message_ids,
+        "subscribers": subscriber_ids,
+        "subscriber_message_ids": {
+            str(subscriber_id): list(range(1, per_subscriber + 1))
+            for subscriber_id in subscriber_ids
+        }
+    }])
+
+
+def admin_update(application, bot_main, text):
+    from telegram import Chat, Message, Update, User
+
+    admin_id = bot_main.ADMIN_IDS[0]
+    message = Message(message_id=1,
+                      date=datetime.now(),
+                      chat=Chat(admin_id, Chat.PRIVATE),
+                      from_user=User(admin_id, "Admin", False),
+                      text=text)
+    message.set_bot(application.bot)
+    return Update(update_id=1, message=message)
+
+
+async def run_scenario(bot_main, application, request, args, entry, content,
+                       size):
+    from telegram.ext import CallbackContext
+
+    reset_state(bot_main, args, size)
+    message = make_message(bot_main, content)
+    bot_main.scheduled_messages.append(message)
+    context = CallbackContext(application)
+
+    if entry == "delete":
+        await seed_sent_post(bot_main, application, message, size)
+        update = admin_update(application, bot_main, "/delete_latest")
+
+    request.latencies = []
+    request.sent = 0
+    monitor = LoopMonitor()
+    monitor.start()
+    started = time.perf_counter()
+
+    if entry == "auto":
+        bot_main.auto_scheduling_active = True
+        await bot_main.send_scheduled_message_auto(context, message.id)
+    elif entry == "send":
+        await bot_main.send_first_message(None, context)
+    else:
+        await bot_main.delete_latest_command(update, context)
+
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+
+    latencies = sorted(request.latencies)
+    lags = sorted(monitor.lags)
+    return {
+        "entry": entry,
+        "content": content,
+        "subscribers": size,
+        "seconds": round(elapsed, 3),
+        "messages": request.sent,
+        "messages_per_second": round(request.sent / elapsed, 1)
+        if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "peak_rss_mb": round(monitor.peak_rss / 2**20, 1),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else 0.0
+    }
+
+
+def print_row(result):
+    print(f"{result['entry']:<7}{result['content']:<7}"
+          f"{result['subscribers']:>9} {result['seconds']:>9.1f}s "
+          f"{result['messages']:>9} {result['messages_per_second']:>9.1f} "
+          f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+          f"{result['peak_rss_mb']:>8.1f} {result['loop_lag_p99_ms']:>8.1f} "
+          f"{result['loop_lag_max_ms']:>8.1f}",
+          flush=True)
+
+
+async def run_benchmarks(bot_main, api_url, args):
+    application, request = build_application(bot_main, api_url, args)
+    results = []
+    async with application:
+        print(f"{'entry':<7}{'kind':<7}{'subs':>9} {'time':>10} "
+              f"{'msgs':>9} {'msgs/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'rss MB':>8} {'lag p99':>8} {'lag max':>8}")
+        for size in args.sizes:
+            for content in args.contents:
+                for entry in args.entries:
+                    result = await run_scenario(bot_main, application,
+                                                request, args, entry,
+                                                content, size)
+                    print_row(result)
+                    results.append(result)
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes",
+                        type=lambda value: [parse_size(v) for v in value.split(",")],
+                        default=[1000, 10000],
+                        help="subscriber counts, e.g. 1k,10k,100k,1m")
+    parser.add_argument("--contents",
+                        type=lambda value: value.split(","),
+                        default=list(CONTENTS),
+                        help="any of text,photo,group")
+    parser.add_argument("--entries",
+                        type=lambda value: value.split(","),
+                        default=list(ENTRYPOINTS),
+                        help="any of auto,send,delete")
+    parser.add_argument("--rate",
+                        type=float,
+                        default=0,
+                        help="global send rate in msg/s, 0 for unlimited")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=256)
+    parser.add_argument("--chat-interval",
+                        type=float,
+                        default=None,
+                        help="override the per-chat send interval in seconds")
+    parser.add_argument("--latency", type=float, default=30)
+    parser.add_argument("--jitter", type=float, default=10)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--blocked-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    for value, allowed in ((args.contents, CONTENTS), (args.entries,
+                                                       ENTRYPOINTS)):
+        unknown = set(value) - set(allowed)
+        if unknown:
+            sys.exit(f"Unknown choice(s): {', '.join(sorted(unknown))}")
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    process, api_url = start_fake_api(args)
+    workdir = tempfile.TemporaryDirectory(prefix="broadcast-bench-")
+    try:
+        # main.py keeps its state files and log in the working directory
+        os.chdir(workdir.name)
+        sys.path.insert(0, REPO_DIR)
+        import main as bot_main
+
+        logging.getLogger().setLevel(
+            logging.INFO if args.verbose else logging.CRITICAL)
+        results = asyncio.run(run_benchmarks(bot_main, api_url, args))
+        # Saves are written in the background; let them land in workdir
+        bot_main.persistence_io.shutdown()
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        os.chdir(REPO_DIR)
+        process.terminate()
+        process.wait()
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
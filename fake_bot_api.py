@@ -0,0 +1,516 @@
+"""Local stand-in for the Telegram Bot API, for load testing the bot offline
+
+Start it, then point the bot at it:
+
+    python fake_bot_api.py --port 8081 --latency 40 --flood-rate 0.01
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot BOT_TOKEN=123:fake python main.py
+
+It answers the methods main.py uses (sending, copying, forwarding, deleting,
+chat and member lookups, polling) with well-formed fake objects. Latency,
+429 flood waits, users who blocked the bot and channels where the bot is not
+an admin can all be injected. GET /stats returns per-method counters as JSON.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+# Request fields that python-telegram-bot sends JSON-encoded
+JSON_FIELDS = {
+    "chat_id", "from_chat_id", "message_id", "message_ids", "user_id",
+    "media", "reply_markup", "entities", "caption_entities", "offset",
+    "limit", "timeout", "disable_notification", "protect_content"
+}
+
+# Chats with negative IDs are channels; messages there are kept so they can
+# be forwarded, copied and deleted later
+CHANNEL_HISTORY_LIMIT = 10000
+
+
+class FakeBotAPIError(Exception):
+    """Error answered to the client as a Bot API error response"""
+
+    def __init__(self, status, description, parameters=None):
+        super().__init__(description)
+        self.status = status
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeBotAPI:
+    """State and method handlers of the fake Bot API"""
+
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.stats = Counter()
+        self.next_message_id = {}
+        self.channel_messages = {}
+        self.not_admin = set(config.not_admin)
+        self.recent_sends = deque()
+        self.started = time.time()
+        self.update_id = 0
+        for chat_id, count in config.seed_channel:
+            self.seed_channel(chat_id, count)
+
+    # Helpers
+    def _user(self, user_id):
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"User {user_id}"
+        }
+
+    def _bot_user(self, bot_id):
+        return {
+            "id": bot_id,
+            "is_bot": True,
+            "first_name": "Fake Bot",
+            "username": "fake_bot"
+        }
+
+    def _chat(self, chat_id):
+        if chat_id < 0:
+            return {
+                "id": chat_id,
+                "type": "channel",
+                "title": f"Channel {chat_id}"
+            }
+        return {
+            "id": chat_id,
+            "type": "private",
+            "first_name": f"User {chat_id}"
+        }
+
+    def _new_message_id(self, chat_id):
+        message_id = self.next_message_id.get(chat_id, 0) + 1
+        self.next_message_id[chat_id] = message_id
+        return message_id
+
+    def _file(self, kind, value):
+        file_id = value if isinstance(value, str) and not value.startswith(
+            "attach://") else f"fake-{kind}-{self.random.getrandbits(48):x}"
+        item = {"file_id": file_id, "file_unique_id": file_id[-16:]}
+        if kind == "photo":
+            return [dict(item, width=1280, height=720)]
+        if kind == "video":
+            return dict(item, width=1280, height=720, duration=10)
+        if kind in ("audio", "voice"):
+            return dict(item, duration=10)
+        return item
+
+    def _message(self, chat_id, **content):
+        message = {
+            "message_id": self._new_message_id(chat_id),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id)
+        }
+        message.update({k: v for k, v in content.items() if v is not None})
+        if chat_id < 0:
+            history = self.channel_messages.setdefault(chat_id, {})
+            history[message["message_id"]] = message
+            if len(history) > CHANNEL_HISTORY_LIMIT:
+                del history[next(iter(history))]
+        return message
+
+    def _stored_message(self, chat_id, message_id):
+        history = self.channel_messages.get(chat_id)
+        if history is None or message_id not in history:
+            raise FakeBotAPIError(400,
+                                  "Bad Request: message to forward not found")
+        return history[message_id]
+
+    def _content_of(self, message):
+        return {
+            k: v
+            for k, v in message.items()
+            if k not in ("message_id", "date", "chat", "media_group_id")
+        }
+
+    def seed_channel(self, chat_id, count):
+        """Pre-fill a channel with text posts so collection has a history"""
+        for n in range(count):
+            self._message(chat_id, text=f"Seeded post {n + 1}")
+
+    def _is_blocked(self, chat_id):
+        # Deterministic per user, so retries of a blocked user keep failing
+        if chat_id <= 0 or not self.config.blocked_rate:
+            return False
+        return (chat_id * 2654435761) % 1000003 < self.config.blocked_rate * 1000003
+
+    def _check_flood(self, chat_id):
+        config = self.config
+        if config.flood_rate and self.random.random() < config.flood_rate:
+            raise FakeBotAPIError(429,
+                                  f"Too Many Requests: retry after {config.retry_after}",
+                                  {"retry_after": config.retry_after})
+        if config.max_rps:
+            now = time.monotonic()
+            while self.recent_sends and now - self.recent_sends[0] >= 1:
+                self.recent_sends.popleft()
+            if len(self.recent_sends) >= config.max_rps:
+                raise FakeBotAPIError(
+                    429,
+                    f"Too Many Requests: retry after {config.retry_after}",
+                    {"retry_after": config.retry_after})
+            self.recent_sends.append(now)
+
+    def _check_target(self, chat_id):
+        self._check_flood(chat_id)
+        if self._is_blocked(chat_id):
+            raise FakeBotAPIError(403, "Forbidden: bot was blocked by the user")
+        if chat_id in self.not_admin:
+            raise FakeBotAPIError(
+                400, "Bad Request: need administrator rights in the channel chat")
+
+    # Methods
+    async def getMe(self, params, bot_id):
+        return self._bot_user(bot_id)
+
+    async def deleteWebhook(self, params, bot_id):
+        return True
+
+    async def setMyCommands(self, params, bot_id):
+        return True
+
+    async def getUpdates(self, params, bot_id):
+        # Nothing ever happens on the fake server; just hold the long poll
+        await asyncio.sleep(min(float(params.get("timeout") or 0), 10))
+        return []
+
+    async def sendMessage(self, params, bot_id):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        return self._message(chat_id,
+                             text=params.get("text"),
+                             entities=params.get("entities"),
+                             reply_markup=params.get("reply_markup"))
+
+    async def _send_file(self, params, kind):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        return self._message(chat_id,
+                             caption=params.get("caption"),
+                             caption_entities=params.get("caption_entities"),
+                             reply_markup=params.get("reply_markup"),
+                             **{kind: self._file(kind, params.get(kind))})
+
+    async def sendPhoto(self, params, bot_id):
+        return await self._send_file(params, "photo")
+
+    async def sendVideo(self, params, bot_id):
+        return await self._send_file(params, "video")
+
+    async def sendDocument(self, params, bot_id):
+        return await self._send_file(params, "document")
+
+    async def sendAudio(self, params, bot_id):
+        return await self._send_file(params, "audio")
+
+    async def sendVoice(self, params, bot_id):
+        return await self._send_file(params, "voice")
+
+    async def sendMediaGroup(self, params, bot_id):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        group_id = str(self.random.getrandbits(63))
+        messages = []
+        for item in params["media"]:
+            kind = item.get("type", "photo")
+            messages.append(
+                self._message(chat_id,
+                              media_group_id=group_id,
+                              caption=item.get("caption"),
+                              caption_entities=item.get("caption_entities"),
+                              **{kind: self._file(kind, item.get("media"))}))
+        return messages
+
+    async def copyMessage(self, params, bot_id):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        source = self._stored_message(params["from_chat_id"],
+                                      params["message_id"])
+        content = self._content_of(source)
+        if "reply_markup" in params:
+            content["reply_markup"] = params["reply_markup"]
+        return {"message_id": self._message(chat_id, **content)["message_id"]}
+
+    async def copyMessages(self, params, bot_id):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        sources = [
+            self._stored_message(params["from_chat_id"], message_id)
+            for message_id in params["message_ids"]
+        ]
+        return [{
+            "message_id":
+            self._message(chat_id, **self._content_of(source))["message_id"]
+        } for source in sources]
+
+    async def forwardMessage(self, params, bot_id):
+        chat_id = params["chat_id"]
+        self._check_target(chat_id)
+        source = self._stored_message(params["from_chat_id"],
+                                      params["message_id"])
+        return self._message(chat_id, **self._content_of(source))
+
+    async def deleteMessage(self, params, bot_id):
+        history = self.channel_messages.get(params["chat_id"], {})
+        if history.pop(params["message_id"], None) is None and params[
+                "chat_id"] < 0:
+            raise FakeBotAPIError(400,
+                                  "Bad Request: message to delete not found")
+        return True
+
+    async def getChat(self, params, bot_id):
+        chat = self._chat(params["chat_id"])
+        chat.update({
+            "accent_color_id": 0,
+            "max_reaction_count": 11,
+            "accepted_gift_types": {
+                "unlimited_gifts": False,
+                "limited_gifts": False,
+                "unique_gifts": False,
+                "premium_subscription": False
+            }
+        })
+        return chat
+
+    async def getChatMember(self, params, bot_id):
+        chat_id, user_id = params["chat_id"], params["user_id"]
+        if user_id == bot_id:
+            if chat_id in self.not_admin:
+                return {"status": "member", "user": self._bot_user(bot_id)}
+            rights = dict.fromkeys(
+                ("can_be_edited", "is_anonymous", "can_restrict_members",
+                 "can_promote_members", "can_post_stories",
+                 "can_edit_stories", "can_delete_stories"), False)
+            rights.update(
+                dict.fromkeys(
+                    ("can_manage_chat", "can_delete_messages",
+                     "can_manage_video_chats", "can_change_info",
+                     "can_invite_users", "can_post_messages",
+                     "can_edit_messages"), True))
+            return dict(rights,
+                        status="administrator",
+                        user=self._bot_user(bot_id))
+        if self.random.random() < self.config.non_member_rate:
+            return {
+                "status": "left",
+                "user": self._user(user_id)
+            }
+        return {"status": "member", "user": self._user(user_id)}
+
+    async def getFile(self, params, bot_id):
+        return {
+            "file_id": params["file_id"],
+            "file_unique_id": params["file_id"][-16:],
+            "file_size": 1024,
+            "file_path": f"files/{params['file_id']}"
+        }
+
+    async def call(self, method, params, bot_id):
+        handler = getattr(self, method, None)
+        if handler is None or method.startswith("_"):
+            raise FakeBotAPIError(404, "Not Found: method not found")
+        self.stats[method] += 1
+        if self.config.latency or self.config.jitter:
+            await asyncio.sleep(
+                max(0, self.config.latency +
+                    self.random.uniform(-1, 1) * self.config.jitter) / 1000)
+        return await handler(params, bot_id)
+
+    def stats_snapshot(self):
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "calls": {
+                key: value
+                for key, value in self.stats.items()
+                if not key.startswith("error_")
+            },
+            "errors": {
+                key: value
+                for key, value in self.stats.items()
+                if key.startswith("error_")
+            }
+        }
+
+
+def parse_params(content_type, body):
+    """Decode a form-encoded or multipart request body into a dict"""
+    if not body:
+        return {}
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        raw = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                raw[name] = f"attach://{name}"
+            else:
+                raw[name] = part.get_content()
+    elif content_type.startswith("application/json"):
+        return json.loads(body)
+    else:
+        raw = dict(parse_qsl(body.decode(), keep_blank_values=True))
+
+    params = {}
+    for key, value in raw.items():
+        if key in JSON_FIELDS:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        params[key] = value
+    return params
+
+
+async def handle_connection(api, reader, writer):
+    """Serve HTTP/1.1 requests on one keep-alive connection"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            verb, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n",
+                                                            b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(
+                int(headers.get("content-length", 0)))
+
+            status, payload = await dispatch(api, verb, path, headers, body)
+            data = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def dispatch(api, verb, path, headers, body):
+    if verb == "GET" and path == "/stats":
+        return 200, api.stats_snapshot()
+
+    # Paths look like /bot<token>/<method>
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) != 2 or not parts[0].startswith("bot"):
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+    token, method = parts[0][3:], parts[1]
+    bot_id = int(token.split(":")[0]) if token.split(":")[0].isdigit() else 1
+
+    try:
+        params = parse_params(headers.get("content-type", ""), body)
+        result = await api.call(method, params, bot_id)
+        return 200, {"ok": True, "result": result}
+    except FakeBotAPIError as e:
+        api.stats[f"error_{e.status}"] += 1
+        response = {
+            "ok": False,
+            "error_code": e.status,
+            "description": e.description
+        }
+        if e.parameters:
+            response["parameters"] = e.parameters
+        return e.status, response
+    except (KeyError, TypeError, ValueError) as e:
+        api.stats["error_400"] += 1
+        return 400, {
+            "ok": False,
+            "error_code": 400,
+            "description": f"Bad Request: {e}"
+        }
+
+
+async def start_server(config):
+    """Start the fake API and return (server, api) without blocking"""
+    api = FakeBotAPI(config)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(api, reader, writer),
+        config.host, config.port)
+    return server, api
+
+
+def parse_channel_seed(value):
+    chat_id, _, count = value.partition(":")
+    return int(chat_id), int(count or 100)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency",
+                        type=float,
+                        default=30,
+                        help="mean response latency in ms")
+    parser.add_argument("--jitter",
+                        type=float,
+                        default=10,
+                        help="latency jitter in ms (uniform +/-)")
+    parser.add_argument("--flood-rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of sends answered with a 429")
+    parser.add_argument("--max-rps",
+                        type=int,
+                        default=0,
+                        help="answer 429 above this many sends per second")
+    parser.add_argument("--retry-after",
+                        type=int,
+                        default=1,
+                        help="retry_after seconds in injected 429s")
+    parser.add_argument("--blocked-rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of users who blocked the bot")
+    parser.add_argument("--non-member-rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of users reported as not in a channel")
+    parser.add_argument("--not-admin",
+                        type=int,
+                        action="append",
+                        default=[],
+                        help="channel where the bot is not an admin, e.g. --not-admin=-100123")
+    parser.add_argument("--seed-channel",
+                        type=parse_channel_seed,
+                        action="append",
+                        default=[],
+                        metavar="CHAT_ID[:COUNT]",
+                        help="pre-fill a channel with COUNT posts, e.g. --seed-channel=-100123:500")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+async def serve(config):
+    server, api = await start_server(config)
+    logging.info(f"Fake Bot API listening on http://{config.host}:{config.port}/bot")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        logging.info(f"Fake Bot API stats: {api.stats_snapshot()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO)
+    try:
+        asyncio.run(serve(build_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
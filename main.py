@@ -1,18 +1,34 @@
 import logging
 import os
 from telegram import Update, MessageEntity, InputMediaPhoto, InputMediaVideo, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler
-from datetime import datetime, timedelta
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler, ChatMemberHandler, BaseRateLimiter
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+from datetime import datetime, time as dtime, timedelta
 import pytz
 import json
 import os
 import asyncio
+import functools
+import hashlib
+import heapq
+import sqlite3
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from types import MappingProxyType
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import aiofiles
+import orjson
 
 # Bot Configuration
 BOT_TOKEN = os.getenv(
     "BOT_TOKEN") or "BOT_TOKEN"
+# Optional Bot API endpoint, e.g. a local Bot API server or fake_bot_api.py
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
 ADMIN_IDS = [
     int(id.strip()) for id in os.getenv("ADMIN_IDS", "7489624146").split(",")
     if id.strip()
@@ -34,14 +50,79 @@ logging.basicConfig(
 # Initialize scheduler with timezone
 cairo_tz = pytz.timezone('Africa/Cairo')
 scheduler = AsyncIOScheduler(timezone=cairo_tz)
+# Cairo hours that auto sends go out at; see SlotCalendar for the other rules
 selected_times = [1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23]
+# "9,13,21" replaces selected_times
+SEND_HOURS = os.getenv("SEND_HOURS", "")
+# "fri=12,18;sat=" gives weekdays their own hours (none on Saturdays here)
+SEND_WEEKDAY_HOURS = os.getenv("SEND_WEEKDAY_HOURS", "")
+# "2026-12-24T18:00/2026-12-26T00:00;..." Cairo time windows with no sends
+SEND_BLACKOUTS = os.getenv("SEND_BLACKOUTS", "")
+# "-1001234567890=9,21;..." limits a channel to auto sends at these hours
+CHANNEL_SEND_HOURS = os.getenv("CHANNEL_SEND_HOURS", "")
 
 # Constants
 COLLECTED_POSTS_FILE = "collected_posts.json"
+# How often (seconds) the in-memory collected and top posts are checked for
+# changes made to storage outside the bot
+STORAGE_CHECK_INTERVAL = float(os.getenv("STORAGE_CHECK_INTERVAL", "5"))
 FAILED_SUBSCRIBERS_FILE = "failed_subscribers.json"
 SENT_POSTS_TRACKING_FILE = "sent_posts_tracking.json"
 DAILY_ANALYTICS_FILE = "daily_analytics.json"
 
+# "json" keeps every dataset in its own file, "sqlite" keeps them all in one
+# database (existing JSON files are imported on first start)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+STORAGE_DB_FILE = os.getenv("STORAGE_DB_FILE", "bot_state.db")
+# New and removed subscribers are appended to this log between snapshots of
+# SUBSCRIBERS_FILE; the log is folded into a snapshot after this many entries
+SUBSCRIBERS_LOG_FILE = "subscribers.log"
+SUBSCRIBERS_LOG_COMPACT_EVERY = int(
+    os.getenv("SUBSCRIBERS_LOG_COMPACT_EVERY", "1000"))
+# In memory, changes are folded into the sorted subscriber array once this
+# many have accumulated (or when the IDs are iterated)
+SUBSCRIBERS_DELTA_LIMIT = int(os.getenv("SUBSCRIBERS_DELTA_LIMIT", "10000"))
+# JSON snapshots keep this many generations (the current file included)
+SNAPSHOT_GENERATIONS = int(os.getenv("SNAPSHOT_GENERATIONS", "3"))
+# Version of the stored state documents, written to each as "schema_version".
+# Files without one are version 1; see upgrade_document() and
+# migrate_state.py.
+STATE_SCHEMA_VERSION = 2
+# Changed datasets are written at most once per interval (seconds)
+PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", "10"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "50"))
+LOOP_LAG_REPORT_INTERVAL = float(os.getenv("LOOP_LAG_REPORT_INTERVAL", "600"))
+
+# Broadcast settings (Telegram allows bots ~30 messages per second overall)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE_LIMIT = float(os.getenv("BROADCAST_RATE_LIMIT", "30"))
+BROADCAST_MAX_REQUEUES = int(os.getenv("BROADCAST_MAX_REQUEUES", "3"))
+# Bounds for the adaptive controller, which starts from the values above
+BROADCAST_MAX_CONCURRENCY = int(os.getenv("BROADCAST_MAX_CONCURRENCY", "50"))
+BROADCAST_MIN_RATE = float(os.getenv("BROADCAST_MIN_RATE", "1"))
+BROADCAST_MAX_RATE = float(
+    os.getenv("BROADCAST_MAX_RATE", str(BROADCAST_RATE_LIMIT)))
+BROADCAST_BACKOFF_FACTOR = 0.5
+# "send" delivers the message body to each subscriber, "copy" posts it to the
+# primary channel once and copies that post to every subscriber
+BROADCAST_MODE = os.getenv("BROADCAST_MODE", "send")
+CHANNEL_SEND_RETRIES = int(os.getenv("CHANNEL_SEND_RETRIES", "3"))
+CHANNEL_RETRY_DELAY = float(os.getenv("CHANNEL_RETRY_DELAY", "2"))
+BROADCAST_JOURNAL_FILE = "broadcast_journal.json"
+# Failed recipients of unfinished broadcasts, one "<broadcast_id> <chat_id>"
+# line each, appended as they fail rather than rewritten with every save
+BROADCAST_FAILURES_LOG_FILE = "broadcast_failures.log"
+BROADCAST_JOURNAL_FLUSH_EVERY = int(
+    os.getenv("BROADCAST_JOURNAL_FLUSH_EVERY", "100"))
+
+# Flood control settings
+PRIVATE_CHAT_INTERVAL = 1.0  # ~1 message per second to the same user
+GROUP_CHAT_INTERVAL = 3.0  # ~20 messages per minute in groups and channels
+FLOOD_MAX_RETRIES = int(os.getenv("FLOOD_MAX_RETRIES", "5"))
+
+# How long chat details and the bot's own channel rights are cached (seconds)
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "600"))
+
 # Store channel link and archive button
 CHANNEL_LINK_FILE = "channel_link.txt"
 current_channel_link = "https://t.me/+1t-w4sxo8t00ZTk0"
@@ -53,6 +134,603 @@ waiting_for_channel_link = set(
 )  # Store user IDs waiting to provide channel link
 
 
+# Storage backends
+def encode_json(data):
+    """Serialize data to compact JSON bytes
+
+    orjson is several times faster than json for the state files, and
+    OPT_NON_STR_KEYS lets int keys through the way json.dumps does.
+    """
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+def decode_json(content):
+    """Parse JSON from str or bytes"""
+    return orjson.loads(content)
+
+
+def snapshot_generation(path, generation):
+    """Path of an older snapshot; generation 0 is the current file"""
+    return f"{path}.{generation}" if generation else path
+
+
+def _fsync_directory(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # Directories can't be opened for fsync on every platform
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, chunks):
+    """Write byte chunks to path and fsync it; return their sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            digest.update(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return digest.hexdigest()
+
+
+def write_snapshot(path, content, generations=SNAPSHOT_GENERATIONS):
+    """Atomically replace path with content, keeping older generations
+
+    The content goes to a temp file that is fsynced and renamed over path,
+    so a crash leaves either the old or the new snapshot, never a torn
+    one. The replaced snapshots are kept as path.1 (newest) up to
+    path.<generations - 1>, each with its sha256 in a .sha256 file
+    alongside.
+    """
+    write_snapshot_stream(path, (content, ), generations)
+
+
+def write_snapshot_stream(path, chunks, generations=SNAPSHOT_GENERATIONS):
+    """write_snapshot() for content produced as an iterable of byte chunks"""
+    temp_path = f"{path}.tmp"
+    try:
+        checksum = _write_file(temp_path, chunks)
+    except BaseException:
+        # The chunks can come from a generator that fails part way
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # The new checksum is on disk before the new content is renamed into
+    # place; see snapshot_checksum_matches()
+    _write_file(f"{path}.sha256.tmp", (checksum.encode(), ))
+    for generation in range(generations - 1, 0, -1):
+        older = snapshot_generation(path, generation - 1)
+        newer = snapshot_generation(path, generation)
+        if os.path.exists(older):
+            os.replace(older, newer)
+            if os.path.exists(f"{older}.sha256"):
+                os.replace(f"{older}.sha256", f"{newer}.sha256")
+            elif os.path.exists(f"{newer}.sha256"):
+                os.remove(f"{newer}.sha256")
+    os.replace(temp_path, path)
+    os.replace(f"{path}.sha256.tmp", f"{path}.sha256")
+    _fsync_directory(path)
+
+
+def snapshot_checksum_matches(snapshot_path, digest):
+    """Whether digest is the recorded sha256 of snapshot_path
+
+    A crash between renaming a new snapshot into place and renaming its
+    checksum leaves the checksum in .sha256.tmp, so that one counts too.
+    """
+    for checksum_path in (f"{snapshot_path}.sha256",
+                          f"{snapshot_path}.sha256.tmp"):
+        if os.path.exists(checksum_path):
+            with open(checksum_path, 'r') as f:
+                if f.read().strip() == digest:
+                    return True
+    return False
+
+
+def read_snapshot(path, generations=SNAPSHOT_GENERATIONS):
+    """Return the newest snapshot of path that passes verification
+
+    A generation is skipped if its checksum doesn't match or it doesn't
+    parse. Files without a checksum (written before snapshots had one)
+    only need to parse. Returns None if no generation is usable.
+    """
+    for generation in range(generations):
+        snapshot_path = snapshot_generation(path, generation)
+        if not os.path.exists(snapshot_path):
+            continue
+        with open(snapshot_path, 'rb') as f:
+            content = f.read()
+        if (os.path.exists(f"{snapshot_path}.sha256")
+                and not snapshot_checksum_matches(
+                    snapshot_path,
+                    hashlib.sha256(content).hexdigest())):
+            logging.warning(f"Checksum mismatch in {snapshot_path}")
+            continue
+        try:
+            data = decode_json(content)
+        except ValueError as e:
+            logging.warning(f"Unreadable snapshot {snapshot_path}: {e}")
+            continue
+        if generation:
+            logging.warning(f"Recovered {path} from {snapshot_path}")
+        return data
+    return None
+
+
+# Record lists whose entries gained fields after version 1, by dataset
+UPGRADED_RECORDS = {
+    SCHEDULED_MESSAGES_FILE: "messages",
+    TOP_POSTS_FILE: "top_posts",
+    COLLECTED_POSTS_FILE: "collected_posts"
+}
+
+
+def upgrade_record(name, record):
+    """Fill in fields a version 1 record of the dataset may be missing"""
+    if name == COLLECTED_POSTS_FILE:
+        record.setdefault("is_media_group", False)
+        record.setdefault("media_group_size", 1)
+    else:
+        record.setdefault("media_group_id", None)
+        record.setdefault("local_files", [])
+        record.setdefault("buttons", None)
+    return record
+
+
+def upgrade_document(name, data):
+    """Bring a stored document up to STATE_SCHEMA_VERSION in place
+
+    Documents written by a newer version of the bot are refused rather
+    than silently losing fields on the next save.
+    """
+    version = data.get("schema_version", 1)
+    if version > STATE_SCHEMA_VERSION:
+        raise ValueError(
+            f"{name} has schema version {version}, newer than {STATE_SCHEMA_VERSION}"
+        )
+    if version < 2 and name in UPGRADED_RECORDS:
+        for record in data.get(UPGRADED_RECORDS[name], []):
+            upgrade_record(name, record)
+    data["schema_version"] = STATE_SCHEMA_VERSION
+    return data
+
+
+def encode_subscribers(user_ids, chunk_size=10000):
+    """Yield the subscribers document as JSON byte chunks
+
+    Compact rather than one ID per line, and encoded a chunk at a time:
+    a single json.dumps call over millions of IDs would hold the GIL, and
+    so stall the event loop, for the whole encode. user_ids can be any
+    iterable, so IDs can be streamed straight from another store.
+    """
+    user_ids = iter(user_ids)
+    yield b'{"user_ids":['
+    separator = b""
+    while True:
+        chunk = list(islice(user_ids, chunk_size))
+        if not chunk:
+            break
+        yield separator + ",".join(map(str, chunk)).encode()
+        separator = b","
+    yield f'],"schema_version":{STATE_SCHEMA_VERSION}}}'.encode()
+
+
+def read_subscriber_log():
+    """Yield the ("+" or "-", user_id) entries of the subscriber log in order"""
+    with open(SUBSCRIBERS_LOG_FILE, 'r') as f:
+        for line in f:
+            # A crash can leave a torn last line; skip anything that isn't a
+            # complete entry
+            op, user_id = line[:1], line[1:].strip()
+            if not line.endswith("\n") or not user_id.isdigit():
+                continue
+            yield op, int(user_id)
+
+
+class JSONStorage:
+    """Keeps every dataset in its own JSON file, rewritten whole on save
+
+    Datasets are named after their file and stored as the JSON document the
+    bot has always written there, through write_snapshot() so a crash
+    mid-save can't corrupt them. Subscribers are the exception: changes are
+    appended to SUBSCRIBERS_LOG_FILE as "+id"/"-id" lines and replayed over
+    the last snapshot on load, so adding one costs the same however many
+    there are. The log is compacted into a new snapshot every
+    SUBSCRIBERS_LOG_COMPACT_EVERY entries and on every full save.
+    """
+
+    # Only subscribers have row-level writes (through the log)
+    row_writes = False
+
+    def __init__(self):
+        self._subscriber_log = None
+        self._subscriber_log_entries = None
+
+    def load(self, name):
+        """Return the stored document, or None if there is none"""
+        data = self._read(name)
+        if name == SUBSCRIBERS_FILE and os.path.exists(SUBSCRIBERS_LOG_FILE):
+            user_ids = set(data.get("user_ids", []) if data else [])
+            entries = 0
+            for op, user_id in read_subscriber_log():
+                entries += 1
+                if op == "+":
+                    user_ids.add(user_id)
+                elif op == "-":
+                    user_ids.discard(user_id)
+            self._subscriber_log_entries = entries
+            if data is not None or entries:
+                data = {"user_ids": list(user_ids)}
+        return upgrade_document(name, data) if data is not None else None
+
+    def _read(self, name):
+        return read_snapshot(name)
+
+    def version(self, name):
+        """Token that changes whenever the dataset's file is replaced"""
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def save(self, name, data):
+        if name == SUBSCRIBERS_FILE:
+            write_snapshot_stream(name,
+                                  encode_subscribers(data["user_ids"]))
+        else:
+            write_snapshot(
+                name,
+                encode_json(dict(data, schema_version=STATE_SCHEMA_VERSION)))
+        if name == SUBSCRIBERS_FILE:
+            # The snapshot now holds everything the log recorded
+            self._close_subscriber_log()
+            open(SUBSCRIBERS_LOG_FILE, 'w').close()
+            self._subscriber_log_entries = 0
+
+    def _append_subscriber_log(self, op, user_ids):
+        if self._subscriber_log_entries is None:
+            self.load(SUBSCRIBERS_FILE)
+        if self._subscriber_log is None:
+            self._subscriber_log = open(SUBSCRIBERS_LOG_FILE, 'a')
+        self._subscriber_log.writelines(f"{op}{user_id}\n"
+                                        for user_id in user_ids)
+        self._subscriber_log.flush()
+        self._subscriber_log_entries = (self._subscriber_log_entries or
+                                        0) + len(user_ids)
+        if self._subscriber_log_entries >= SUBSCRIBERS_LOG_COMPACT_EVERY:
+            self.save(SUBSCRIBERS_FILE, self.load(SUBSCRIBERS_FILE))
+
+    def _close_subscriber_log(self):
+        if self._subscriber_log is not None:
+            self._subscriber_log.close()
+            self._subscriber_log = None
+
+    def add_subscribers(self, user_ids):
+        self._append_subscriber_log("+", list(user_ids))
+
+    def remove_subscribers(self, user_ids):
+        self._append_subscriber_log("-", list(user_ids))
+
+    def close(self):
+        self._close_subscriber_log()
+
+
+class SQLiteStorage:
+    """Keeps every dataset in one SQLite database in WAL mode
+
+    Subscribers, failure counts and the scheduled queue have their own
+    tables, so adding a subscriber, counting a failure or editing the queue
+    writes only the affected rows. Other datasets are stored as JSON
+    documents. load() and save() take the same names and documents as
+    JSONStorage, so either backend can sit behind the save_*/load_*
+    functions.
+    """
+
+    row_writes = True
+
+    def __init__(self, path):
+        self.path = path
+        # Opened here but used from the persistence thread
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS subscribers (
+                user_id INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS failed_subscribers (
+                user_id TEXT PRIMARY KEY, failures INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS scheduled_messages (
+                key TEXT PRIMARY KEY, position INTEGER NOT NULL,
+                data TEXT NOT NULL);
+        """)
+        # Last written queue rows, so a save only touches rows that changed
+        self._queue_rows = {
+            key: (position, data)
+            for key, position, data in self.db.execute(
+                "SELECT key, position, data FROM scheduled_messages")
+        }
+
+    def _load_document(self, name):
+        row = self.db.execute("SELECT data FROM documents WHERE name = ?",
+                              (name, )).fetchone()
+        return decode_json(row[0]) if row else None
+
+    def _save_document(self, name, data):
+        self.db.execute(
+            "INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)",
+            (name, encode_json(data).decode()))
+
+    def load(self, name):
+        """Return the stored document, or None if there is none"""
+        if name == SUBSCRIBERS_FILE:
+            data = {"user_ids": list(self.iter_subscribers())}
+        elif name == FAILED_SUBSCRIBERS_FILE:
+            data = {"failed_subscribers": dict(self.iter_failures())}
+        else:
+            data = self._load_document(name)
+            if name == SCHEDULED_MESSAGES_FILE and data is not None:
+                data["messages"] = [
+                    decode_json(row[0]) for row in self.db.execute(
+                        "SELECT data FROM scheduled_messages ORDER BY position")
+                ]
+        return upgrade_document(name, data) if data is not None else None
+
+    def iter_subscribers(self):
+        """Stream the subscriber IDs in ascending order"""
+        return (row[0] for row in self.db.execute(
+            "SELECT user_id FROM subscribers ORDER BY user_id"))
+
+    def iter_failures(self):
+        """Stream (user_id, failures) pairs"""
+        return self.db.execute(
+            "SELECT user_id, failures FROM failed_subscribers")
+
+    def version(self, name):
+        """Token that changes when another connection commits a change"""
+        return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def save(self, name, data):
+        with self.db:
+            if name == SUBSCRIBERS_FILE:
+                self.db.execute("DELETE FROM subscribers")
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)",
+                    ((user_id, ) for user_id in data["user_ids"]))
+            elif name == FAILED_SUBSCRIBERS_FILE:
+                self.db.execute("DELETE FROM failed_subscribers")
+                self.db.executemany(
+                    "INSERT INTO failed_subscribers (user_id, failures) VALUES (?, ?)",
+                    data["failed_subscribers"].items())
+            elif name == SCHEDULED_MESSAGES_FILE:
+                settings = dict(data, schema_version=STATE_SCHEMA_VERSION)
+                self._save_queue(settings.pop("messages", []))
+                self._save_document(name, settings)
+            else:
+                self._save_document(
+                    name, dict(data, schema_version=STATE_SCHEMA_VERSION))
+
+    def _save_queue(self, messages):
+        rows = {}
+        for index, message in enumerate(messages):
+            key = message.get("id") or message.get("created_at") or str(
+                index)
+            while key in rows:
+                key += "+"
+            # The queue's own sequence number orders the rows, so taking a
+            # message off the front leaves every other row as it was
+            position = message.get("sequence", index)
+            rows[key] = (position, encode_json(message).decode())
+
+        self.db.executemany(
+            "INSERT OR REPLACE INTO scheduled_messages (key, position, data) VALUES (?, ?, ?)",
+            ((key, position, data)
+             for key, (position, data) in rows.items()
+             if self._queue_rows.get(key) != (position, data)))
+        self.db.executemany("DELETE FROM scheduled_messages WHERE key = ?",
+                            ((key, )
+                             for key in self._queue_rows.keys() - rows.keys()))
+        self._queue_rows = rows
+
+    def add_subscribers(self, user_ids):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)",
+                ((user_id, ) for user_id in user_ids))
+
+    def remove_subscribers(self, user_ids):
+        with self.db:
+            self.db.executemany("DELETE FROM subscribers WHERE user_id = ?",
+                                ((user_id, ) for user_id in user_ids))
+
+    def set_failures(self, counts):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO failed_subscribers (user_id, failures) VALUES (?, ?)",
+                counts.items())
+
+    def remove_failures(self, user_ids):
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM failed_subscribers WHERE user_id = ?",
+                ((str(user_id), ) for user_id in user_ids))
+
+    def import_json(self, source):
+        """Copy the datasets of a JSONStorage into a new database once"""
+        if self._load_document("imported_from_json"):
+            return
+        for name in (SUBSCRIBERS_FILE, FAILED_SUBSCRIBERS_FILE,
+                     SCHEDULED_MESSAGES_FILE, TOP_POSTS_FILE,
+                     COLLECTED_POSTS_FILE, SENT_POSTS_TRACKING_FILE,
+                     DAILY_ANALYTICS_FILE):
+            try:
+                data = source.load(name)
+                if data is not None:
+                    self.save(name, data)
+                    logging.info(f"Imported {name} into {self.path}")
+            except Exception as e:
+                logging.error(f"Failed to import {name} into {self.path}: {e}")
+        self.mark_imported()
+
+    def mark_imported(self):
+        """Record that the JSON files were copied in, so it happens once"""
+        with self.db:
+            self._save_document("imported_from_json",
+                                datetime.now().isoformat())
+
+    def close(self):
+        self.db.close()
+
+
+def open_storage():
+    """Open the storage backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "sqlite":
+        db = SQLiteStorage(STORAGE_DB_FILE)
+        db.import_json(JSONStorage())
+        return db
+    return JSONStorage()
+
+
+storage = open_storage()
+
+
+class PersistenceExecutor:
+    """Runs storage reads and writes on a single background thread
+
+    Serializing and writing a large dataset stalls every in-flight update
+    when done on the event loop, so the save_*/load_* functions hand their
+    storage calls to this thread. Having one worker keeps writes in the
+    order they were submitted and means the backend is only ever used from
+    one thread at a time.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="persistence")
+
+    def submit(self, what, fn, *args):
+        """Queue a write without waiting for it; failures are logged"""
+
+        def write():
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error(f"Failed to save {what}: {e}")
+
+        self._executor.submit(write)
+
+    async def run(self, fn, *args):
+        """Run fn on the persistence thread and return its result"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, fn, *args)
+
+    def shutdown(self):
+        """Wait for every queued write to finish"""
+        self._executor.shutdown(wait=True)
+
+
+persistence_io = PersistenceExecutor()
+
+
+async def monitor_event_loop_lag(interval=0.5):
+    """Measure how late the event loop wakes up and log stalls
+
+    Anything that blocks the loop delays this task's sleep by the same
+    amount, so the lag is a direct measure of how long updates were held
+    up. Stalls over LOOP_LAG_WARN_MS are logged as they happen, with a
+    p99/max summary every LOOP_LAG_REPORT_INTERVAL seconds.
+    """
+    loop = asyncio.get_running_loop()
+    samples = []
+    last_report = loop.time()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        now = loop.time()
+        lag_ms = (now - started - interval) * 1000
+        samples.append(lag_ms)
+        if lag_ms > LOOP_LAG_WARN_MS:
+            logging.warning(f"Event loop stalled for {lag_ms:.0f} ms")
+        if now - last_report >= LOOP_LAG_REPORT_INTERVAL:
+            samples.sort()
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            logging.info(
+                f"Event loop lag over {len(samples)} samples: p99 {p99:.1f} ms, max {samples[-1]:.1f} ms"
+            )
+            samples = []
+            last_report = now
+
+
+class PersistenceManager:
+    """Write-behind persistence for the bot's in-memory datasets
+
+    Mutations call mark_dirty() instead of saving; each dataset is then
+    written by its registered saver at most once per interval, so a burst of
+    changes costs a single save and idle datasets are never rewritten.
+    save_now() writes a dataset immediately and flush_all() writes whatever
+    is still pending, which runs on shutdown.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._savers = {}
+        self._intervals = {}
+        self._dirty = set()
+        self._last_flush = {}
+        self._pending = {}
+
+    def register(self, name, saver, interval=None):
+        self._savers[name] = saver
+        self._intervals[name] = self.interval if interval is None else interval
+
+    def mark_dirty(self, name):
+        self._dirty.add(name)
+        if name in self._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop there is nothing to defer to
+            self.flush(name)
+            return
+        delay = self._last_flush.get(name, 0) + self._intervals[
+            name] - time.monotonic()
+        self._pending[name] = loop.call_later(max(0, delay), self.flush,
+                                              name)
+
+    def flush(self, name):
+        """Write the dataset if it has unsaved changes"""
+        handle = self._pending.pop(name, None)
+        if handle:
+            handle.cancel()
+        if name not in self._dirty:
+            return
+        self._dirty.discard(name)
+        self._last_flush[name] = time.monotonic()
+        self._savers[name]()
+
+    def save_now(self, name):
+        self._dirty.add(name)
+        self.flush(name)
+
+    def is_dirty(self, name):
+        return name in self._dirty
+
+    def flush_all(self):
+        for name in list(self._dirty):
+            self.flush(name)
+        logging.info("Flushed all pending data")
+
+
+persistence = PersistenceManager(PERSIST_INTERVAL)
+
+
 async def save_channel_link(link):
     """Save channel link to file"""
     global current_channel_link, archive_button_url, archive_button_name
@@ -86,54 +764,81 @@ async def load_channel_link():
 
 # Store scheduled messages and target channels
 def save_scheduled_messages():
-    """Save scheduled messages to JSON file synchronously"""
+    """Queue a save of the scheduled messages on the persistence thread"""
     try:
         data = {
-            "messages": [msg.to_dict() for msg in scheduled_messages],
+            "messages": [
+                dict(msg.to_dict(), sequence=sequence)
+                for sequence, msg in scheduled_messages.items()
+            ],
             "target_channels": list(target_channels),
             "auto_scheduling_active": auto_scheduling_active
         }
-        with open(SCHEDULED_MESSAGES_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        persistence_io.submit("scheduled messages", storage.save,
+                              SCHEDULED_MESSAGES_FILE, data)
         logging.info(f"Saved {len(scheduled_messages)} scheduled messages")
     except Exception as e:
         logging.error(f"Failed to save scheduled messages: {e}")
 
 
-def load_scheduled_messages():
-    """Load scheduled messages from JSON file synchronously"""
+# The queue is saved with save_now() on every change rather than written
+# behind: the admin is told a post is scheduled as soon as it is queued
+persistence.register(SCHEDULED_MESSAGES_FILE, save_scheduled_messages)
+
+
+async def load_scheduled_messages():
+    """Load scheduled messages from storage"""
     global scheduled_messages, target_channels, auto_scheduling_active
     try:
-        if not os.path.exists(SCHEDULED_MESSAGES_FILE):
-            return
-        with open(SCHEDULED_MESSAGES_FILE, 'r') as f:
-            content = f.read()
-            if content.strip():
-                data = json.loads(content)
-                scheduled_messages = [
-                    ScheduledMessage.from_dict(msg_data)
-                    for msg_data in data.get("messages", [])
-                ]
-                target_channels.update(data.get("target_channels", []))
-                auto_scheduling_active = data.get("auto_scheduling_active",
-                                                  False)
-                logging.info(
-                    f"Loaded {len(scheduled_messages)} scheduled messages")
+        data = await persistence_io.run(storage.load,
+                                        SCHEDULED_MESSAGES_FILE)
+        if data:
+            records = data.get("messages", [])
+            sequences = [record.get("sequence") for record in records]
+            scheduled_messages = ScheduledQueue(
+                (ScheduledMessage.from_dict(record) for record in records),
+                None if None in sequences else sequences)
+            target_channels.update(data.get("target_channels", []))
+            slot_calendar.channels_changed()
+            auto_scheduling_active = data.get("auto_scheduling_active",
+                                              False)
+            logging.info(
+                f"Loaded {len(scheduled_messages)} scheduled messages")
     except Exception as e:
         logging.error(f"Failed to load scheduled messages: {e}")
 
 
+def entities_to_data(entities):
+    """Convert MessageEntity objects to Bot API dicts for storage"""
+    return [entity.to_dict() for entity in entities] if entities else None
+
+
+def entities_from_data(data):
+    """Convert stored entity dicts back to MessageEntity objects"""
+    if not data:
+        return None
+    return [MessageEntity.de_json(entity_data, None) for entity_data in data]
+
+
 class ScheduledMessage:
 
-    def __init__(self, media_group_id=None):
+    def __init__(self, media_group_id=None, created_at=None, message_id=None):
+        # Stable across restarts, unlike id(); jobs and the queue index use it
+        self.id = message_id or uuid.uuid4().hex
         self.text = None
         self.media = []
         self.media_group_id = media_group_id
-        self.entities = None
-        self.created_at = datetime.now(pytz.timezone('Europe/London'))
+        # Entities are kept as stored dicts until something needs the
+        # MessageEntity objects, so loading and re-saving a queue never
+        # builds them
+        self._entities = None
+        self._entity_data = None
+        self.created_at = created_at or datetime.now(
+            pytz.timezone('Europe/London'))
         self.send_time = None
         self.local_files = []  # Store paths to locally saved media files
         self.buttons = None  # Store button data if any
+        self._payload = None  # Compiled BroadcastPayload, built on demand
 
     def add_media(self,
                   file_id,
@@ -145,48 +850,52 @@ class ScheduledMessage:
             "file_id": file_id,
             "type": type,
             "caption": caption,
-            "caption_entities": caption_entities
+            "caption_entities": entities_to_data(caption_entities)
         }
         if local_file_path:
             media_data["local_file_path"] = local_file_path
             self.local_files.append(local_file_path)
         self.media.append(media_data)
+        self._payload = None
+
+    @property
+    def entities(self):
+        if self._entities is None and self._entity_data:
+            self._entities = entities_from_data(self._entity_data)
+        return self._entities
+
+    @entities.setter
+    def entities(self, entities):
+        self._entities = entities
+        self._entity_data = None
+        self._payload = None
 
     def set_text(self, text, entities=None):
         self.text = text
         self.entities = entities
+        self._payload = None
 
     def set_buttons(self, buttons):
         self.buttons = buttons
+        self._payload = None
+
+    def payload(self):
+        """Return the compiled BroadcastPayload for this message"""
+        if self._payload is None:
+            self._payload = BroadcastPayload(self)
+        return self._payload
 
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
-        # Convert MessageEntity objects to dictionaries
-        entities_dict = None
-        if self.entities:
-            entities_dict = []
-            for entity in self.entities:
-                entities_dict.append({
-                    "type":
-                    entity.type,
-                    "offset":
-                    entity.offset,
-                    "length":
-                    entity.length,
-                    "url":
-                    entity.url if hasattr(entity, 'url') else None,
-                    "user":
-                    entity.user.to_dict()
-                    if hasattr(entity, 'user') and entity.user else None,
-                    "language":
-                    entity.language if hasattr(entity, 'language') else None
-                })
+        if self._entity_data is None and self._entities:
+            self._entity_data = entities_to_data(self._entities)
 
         return {
+            "id": self.id,
             "text": self.text,
             "media": self.media,
             "media_group_id": self.media_group_id,
-            "entities": entities_dict,
+            "entities": self._entity_data,
             "created_at": self.created_at.isoformat(),
             "send_time":
             self.send_time.isoformat() if self.send_time else None,
@@ -196,27 +905,20 @@ class ScheduledMessage:
 
     @classmethod
     def from_dict(cls, data):
-        """Create instance from dictionary"""
-        msg = cls(data.get("media_group_id"))
+        """Create instance from dictionary
+
+        The record is expected to have been through upgrade_document; version
+        1 entity dicts are valid Bot API entities with some null fields, so
+        they need no conversion.
+        """
+        # Messages saved before IDs existed get a new one here, which is
+        # stored with the next save
+        msg = cls(data.get("media_group_id"),
+                  datetime.fromisoformat(data["created_at"]), data.get("id"))
         msg.text = data.get("text")
         msg.media = data.get("media", [])
+        msg._entity_data = data.get("entities") or None
 
-        # Convert dictionaries back to MessageEntity objects
-        if data.get("entities"):
-            msg.entities = []
-            for entity_data in data["entities"]:
-                entity = MessageEntity(
-                    type=entity_data["type"],
-                    offset=entity_data["offset"],
-                    length=entity_data["length"],
-                    url=entity_data.get("url"),
-                    user=None,  # User objects are complex, skip for now
-                    language=entity_data.get("language"))
-                msg.entities.append(entity)
-        else:
-            msg.entities = None
-
-        msg.created_at = datetime.fromisoformat(data["created_at"])
         msg.send_time = datetime.fromisoformat(
             data["send_time"]) if data.get("send_time") else None
         msg.local_files = data.get("local_files", [])
@@ -247,6 +949,12 @@ class ScheduledMessage:
             return f"[{time_str}] Media ({', '.join(media_types)}): {preview}"
         return f"[{time_str}] Empty message"
 
+    def content_key(self):
+        """Hashable key that is equal for messages is_duplicate_of() matches"""
+        if self.text:
+            return ("text", self.text)
+        return ("media", tuple(sorted(m['file_id'] for m in self.media)))
+
     def is_duplicate_of(self, other):
         """Compare two scheduled messages for duplicate detection"""
         # If one has text and other doesn't, they're different
@@ -267,8 +975,229 @@ class ScheduledMessage:
         return self_ids == other_ids
 
 
+class BroadcastPayload:
+    """Send-ready form of a ScheduledMessage
+
+    Built once per message and reused for every channel and recipient, so
+    the media list and markup are not rebuilt for each send. Instances are
+    immutable; editing the message builds a new payload.
+    """
+
+    __slots__ = ("text", "entities", "media_group", "single_media")
+
+    def __init__(self, scheduled_msg):
+        entities = tuple(
+            scheduled_msg.entities) if scheduled_msg.entities else None
+        media_group = []
+        for idx, media in enumerate(scheduled_msg.media):
+            caption = media['caption'] if idx == 0 else None
+            caption_entities = entities_from_data(
+                media['caption_entities']) if idx == 0 else None
+            if media['type'] == 'photo':
+                media_group.append(
+                    InputMediaPhoto(media=media['file_id'],
+                                    caption=caption,
+                                    caption_entities=caption_entities))
+            elif media['type'] == 'video':
+                media_group.append(
+                    InputMediaVideo(media=media['file_id'],
+                                    caption=caption,
+                                    caption_entities=caption_entities))
+        single_media = None
+        if len(scheduled_msg.media) == 1:
+            caption_entities = entities_from_data(
+                scheduled_msg.media[0]['caption_entities'])
+            single_media = MappingProxyType(
+                dict(scheduled_msg.media[0],
+                     caption_entities=tuple(caption_entities)
+                     if caption_entities else None))
+
+        object.__setattr__(self, "text", scheduled_msg.text)
+        object.__setattr__(self, "entities", entities)
+        object.__setattr__(self, "media_group", tuple(media_group))
+        object.__setattr__(self, "single_media", single_media)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BroadcastPayload is immutable")
+
+    async def send_to_channel(self, bot, chat_id):
+        """Post to a channel and return the sent messages"""
+        if self.text and not self.media_group:
+            return (await bot.send_message(chat_id=chat_id,
+                                           text=self.text,
+                                           entities=self.entities), )
+        if self.media_group:
+            return await bot.send_media_group(chat_id=chat_id,
+                                              media=self.media_group)
+        return ()
+
+    async def send_to_user(self,
+                           bot,
+                           chat_id,
+                           navigation=True,
+                           protect_content=True):
+        """Send to a private chat, optionally with the navigation buttons"""
+        reply_markup = NAVIGATION_MARKUP if navigation else None
+        if self.text and not self.media_group:
+            await bot.send_message(chat_id=chat_id,
+                                   text=self.text,
+                                   entities=self.entities,
+                                   reply_markup=reply_markup,
+                                   protect_content=protect_content)
+        elif self.single_media:
+            media = self.single_media
+            if media['type'] == 'photo':
+                await bot.send_photo(
+                    chat_id=chat_id,
+                    photo=media['file_id'],
+                    caption=media['caption'],
+                    caption_entities=media['caption_entities'],
+                    reply_markup=reply_markup,
+                    protect_content=protect_content)
+            elif media['type'] == 'video':
+                await bot.send_video(
+                    chat_id=chat_id,
+                    video=media['file_id'],
+                    caption=media['caption'],
+                    caption_entities=media['caption_entities'],
+                    reply_markup=reply_markup,
+                    protect_content=protect_content)
+        elif self.media_group:
+            await bot.send_media_group(chat_id=chat_id,
+                                       media=self.media_group,
+                                       protect_content=protect_content)
+            if navigation:
+                # Media groups can't carry buttons, so send them separately
+                await bot.send_message(chat_id=chat_id,
+                                       text=NAVIGATION_TEXT,
+                                       reply_markup=NAVIGATION_MARKUP)
+
+
+class ChannelPostCopy:
+    """Broadcast source that copies an existing channel post to each user
+
+    Copying only references the channel post, so requests stay small and a
+    media group reaches a user in a single copy_messages call.
+    """
+
+    __slots__ = ("from_chat_id", "message_ids")
+
+    def __init__(self, from_chat_id, message_ids):
+        self.from_chat_id = from_chat_id
+        self.message_ids = tuple(message_ids)
+
+    async def send_to_user(self,
+                           bot,
+                           chat_id,
+                           navigation=True,
+                           protect_content=True):
+        """Copy the channel post to a private chat"""
+        if len(self.message_ids) == 1:
+            await bot.copy_message(
+                chat_id=chat_id,
+                from_chat_id=self.from_chat_id,
+                message_id=self.message_ids[0],
+                reply_markup=NAVIGATION_MARKUP if navigation else None,
+                protect_content=protect_content)
+        else:
+            await bot.copy_messages(chat_id=chat_id,
+                                    from_chat_id=self.from_chat_id,
+                                    message_ids=self.message_ids,
+                                    protect_content=protect_content)
+
+
+class SubscriberStore:
+    """Set of subscriber IDs kept as a sorted array of 64-bit ints
+
+    An ID costs 8 bytes instead of the ~70 of a set entry, membership is a
+    binary search and iteration is in ID order. Additions and removals
+    are buffered in two small sets and folded into the array every
+    SUBSCRIBERS_DELTA_LIMIT changes or before it is iterated. The array is
+    replaced rather than modified, so snapshot() can hand it to a
+    broadcast or a background save without copying.
+    """
+
+    def __init__(self, user_ids=()):
+        self._ids = array('q', sorted(set(user_ids)))
+        self._added = set()
+        self._removed = set()
+
+    def _in_array(self, user_id):
+        i = bisect_left(self._ids, user_id)
+        return i < len(self._ids) and self._ids[i] == user_id
+
+    def __contains__(self, user_id):
+        if user_id in self._added:
+            return True
+        return user_id not in self._removed and self._in_array(user_id)
+
+    def __len__(self):
+        return len(self._ids) + len(self._added) - len(self._removed)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def add(self, user_id):
+        if user_id in self._removed:
+            self._removed.discard(user_id)
+        elif not self._in_array(user_id):
+            self._added.add(user_id)
+        self._compact_if_needed()
+
+    def discard(self, user_id):
+        if user_id in self._added:
+            self._added.discard(user_id)
+        elif self._in_array(user_id):
+            self._removed.add(user_id)
+        self._compact_if_needed()
+
+    def update(self, user_ids):
+        """Add many IDs at once and return the set of those that were new"""
+        new_ids = {user_id for user_id in user_ids if user_id not in self}
+        self._added |= new_ids - self._removed
+        self._removed -= new_ids
+        self._compact_if_needed()
+        return new_ids
+
+    def clear(self):
+        self._ids = array('q')
+        self._added.clear()
+        self._removed.clear()
+
+    def snapshot(self):
+        """Return all IDs as a sorted array that later changes won't touch"""
+        self.compact()
+        return self._ids
+
+    def _compact_if_needed(self):
+        if len(self._added) + len(self._removed) >= SUBSCRIBERS_DELTA_LIMIT:
+            self.compact()
+
+    def compact(self):
+        """Fold the buffered changes into a new sorted array"""
+        if not self._added and not self._removed:
+            return
+        # Copy the runs between changed IDs; slices copy at C speed, so this
+        # costs one pass over memory plus a step per change
+        ids = self._ids
+        merged = array('q')
+        start = 0
+        for user_id in sorted(self._added | self._removed):
+            i = bisect_left(ids, user_id, start)
+            merged.extend(ids[start:i])
+            if user_id in self._added:
+                merged.append(user_id)
+                start = i
+            else:
+                start = i + 1
+        merged.extend(ids[start:])
+        self._ids = merged
+        self._added.clear()
+        self._removed.clear()
+
+
 # Subscriber system variables
-subscribers = set()  # Using set for fast lookup
+subscribers = SubscriberStore()
 top_posts = []
 
 
@@ -283,58 +1212,31 @@ async def auto_add_subscriber(user_id):
         logging.info(
             f"Auto-added subscriber: {user_id} (count: {old_count} -> {new_count})"
         )
-        save_subscribers()
-
-        # Verify the subscriber was actually added and saved
-        if os.path.exists(SUBSCRIBERS_FILE):
-            try:
-                async with aiofiles.open(SUBSCRIBERS_FILE, 'r') as f:
-                    content = await f.read()
-                    if content.strip():
-                        data = json.loads(content)
-                        saved_users = set(data.get("user_ids", []))
-                        if user_id in saved_users:
-                            logging.info(
-                                f"Verified subscriber {user_id} was saved successfully - now has bot access"
-                            )
-                        else:
-                            logging.error(
-                                f"Subscriber {user_id} was NOT saved to file!")
-            except Exception as e:
-                logging.error(f"Failed to verify subscriber save: {e}")
-        else:
-            logging.error(
-                f"Subscribers file {SUBSCRIBERS_FILE} does not exist after save attempt!"
-            )
+        save_subscribers(added=[user_id])
     elif user_id in subscribers:
         logging.info(f"User {user_id} is already a verified subscriber")
 
 
-def save_subscribers():
-    """Save subscribers to JSON file synchronously"""
-    try:
-        current_dir = os.getcwd()
-        logging.info(f"Current working directory: {current_dir}")
-        logging.info(
-            f"Attempting to save {len(subscribers)} subscribers to {SUBSCRIBERS_FILE}"
-        )
-
-        data = {"user_ids": list(subscribers)}
+def save_subscribers(added=None, removed=None):
+    """Queue a save of the subscribers on the persistence thread
 
-        with open(SUBSCRIBERS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-
-        logging.info(
-            f"Successfully saved {len(subscribers)} subscribers to {SUBSCRIBERS_FILE}"
-        )
-
-        # Verify the file was actually written
-        if os.path.exists(SUBSCRIBERS_FILE):
-            file_size = os.path.getsize(SUBSCRIBERS_FILE)
-            logging.info(
-                f"File {SUBSCRIBERS_FILE} size after save: {file_size} bytes")
+    Pass the IDs that were added or removed to write just those entries;
+    with neither, the whole set is saved.
+    """
+    try:
+        if added is not None:
+            persistence_io.submit("subscribers", storage.add_subscribers,
+                                  list(added))
+        elif removed is not None:
+            persistence_io.submit("subscribers", storage.remove_subscribers,
+                                  list(removed))
         else:
-            logging.error(f"File {SUBSCRIBERS_FILE} was not created!")
+            logging.info(f"Attempting to save {len(subscribers)} subscribers")
+            persistence_io.submit("subscribers", storage.save,
+                                  SUBSCRIBERS_FILE,
+                                  {"user_ids": subscribers.snapshot()})
+
+        logging.info(f"Successfully saved {len(subscribers)} subscribers")
 
     except Exception as e:
         logging.error(f"Failed to save subscribers: {e}")
@@ -344,36 +1246,19 @@ def save_subscribers():
 
 
 async def load_subscribers():
-    """Load subscribers from JSON file"""
+    """Load subscribers from storage"""
     global subscribers
     try:
-        current_dir = os.getcwd()
-        logging.info(
-            f"Loading subscribers from {SUBSCRIBERS_FILE} in directory {current_dir}"
-        )
+        logging.info(f"Loading subscribers from {STORAGE_BACKEND} storage")
 
-        if not os.path.exists(SUBSCRIBERS_FILE):
+        data = await persistence_io.run(storage.load, SUBSCRIBERS_FILE)
+        if data is None:
             logging.info(
-                f"Subscribers file {SUBSCRIBERS_FILE} does not exist, starting with empty set"
-            )
+                "No stored subscribers found, starting with empty set")
             return
 
-        file_size = os.path.getsize(SUBSCRIBERS_FILE)
-        logging.info(f"Found subscribers file, size: {file_size} bytes")
-
-        async with aiofiles.open(SUBSCRIBERS_FILE, 'r') as f:
-            content = await f.read()
-            logging.info(
-                f"Read {len(content)} characters from subscribers file")
-
-            if content.strip():
-                data = json.loads(content)
-                subscribers = set(data.get("user_ids", []))
-                logging.info(
-                    f"Successfully loaded {len(subscribers)} subscribers: {list(subscribers)}"
-                )
-            else:
-                logging.info("Subscribers file is empty")
+        subscribers = SubscriberStore(data.get("user_ids", []))
+        logging.info(f"Successfully loaded {len(subscribers)} subscribers")
 
     except Exception as e:
         logging.error(f"Failed to load subscribers: {e}")
@@ -382,38 +1267,501 @@ async def load_subscribers():
         logging.error(f"Full traceback: {traceback.format_exc()}")
 
 
+# top_posts in memory is the source of truth. Every change bumps
+# top_posts_version, which keys the rendered TOP pages; the stored version
+# is what storage.version() returned for the last load or save, so changes
+# made outside the bot can be told apart from our own.
+top_posts_version = 0
+top_posts_stored_version = None
+top_posts_checked_at = 0
+
+
+def top_posts_changed(save=True):
+    """Record a change to top_posts and schedule it to be saved
+
+    Every change to top_posts goes through here, since the version keys
+    the cached TOP pages. Pass save=False when top_posts was just read
+    from storage.
+    """
+    global top_posts_version
+    top_posts_version += 1
+    if save:
+        persistence.mark_dirty(TOP_POSTS_FILE)
+
+
+def write_top_posts(data):
+    """Store the top posts; runs on the persistence thread"""
+    global top_posts_stored_version
+    storage.save(TOP_POSTS_FILE, data)
+    top_posts_stored_version = storage.version(TOP_POSTS_FILE)
+
+
+def read_top_posts():
+    """Return the stored top posts and their version; runs on the
+    persistence thread"""
+    version = storage.version(TOP_POSTS_FILE)
+    return storage.load(TOP_POSTS_FILE), version
+
+
 def save_top_posts():
-    """Save top posts to JSON file synchronously"""
+    """Queue a save of the top posts on the persistence thread"""
     try:
         data = {"top_posts": [post.to_dict() for post in top_posts]}
-        with open(TOP_POSTS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        persistence_io.submit("top posts", write_top_posts, data)
         logging.info(f"Saved {len(top_posts)} top posts")
     except Exception as e:
         logging.error(f"Failed to save top posts: {e}")
 
 
-def load_top_posts():
-    """Load top posts from JSON file synchronously"""
-    global top_posts
+persistence.register(TOP_POSTS_FILE, save_top_posts)
+
+
+async def load_top_posts():
+    """Load top posts from storage"""
+    global top_posts, top_posts_stored_version
     try:
-        if not os.path.exists(TOP_POSTS_FILE):
-            return
-        with open(TOP_POSTS_FILE, 'r') as f:
-            content = f.read()
-            if content.strip():
-                data = json.loads(content)
-                top_posts = [
-                    ScheduledMessage.from_dict(post_data)
-                    for post_data in data.get("top_posts", [])
-                ]
-                logging.info(f"Loaded {len(top_posts)} top posts")
+        data, top_posts_stored_version = await persistence_io.run(
+            read_top_posts)
+        if data:
+            top_posts = [
+                ScheduledMessage.from_dict(post_data)
+                for post_data in data.get("top_posts", [])
+            ]
+            top_posts_changed(save=False)
+            logging.info(f"Loaded {len(top_posts)} top posts")
     except Exception as e:
         logging.error(f"Failed to load top posts: {e}")
 
 
-scheduled_messages = []
+async def refresh_top_posts():
+    """Reload the top posts if storage was changed outside the bot
+
+    Checks at most every STORAGE_CHECK_INTERVAL seconds, so most calls
+    cost nothing. Unsaved changes in memory win over the stored copy.
+    """
+    global top_posts_checked_at
+    now = time.monotonic()
+    if (now - top_posts_checked_at < STORAGE_CHECK_INTERVAL
+            or persistence.is_dirty(TOP_POSTS_FILE)):
+        return
+    top_posts_checked_at = now
+    # Runs after any queued write, which has recorded its own version
+    version = await persistence_io.run(storage.version, TOP_POSTS_FILE)
+    if version != top_posts_stored_version:
+        logging.info("Top posts changed in storage, reloading")
+        await load_top_posts()
+
+
+class ScheduledQueue:
+    """The scheduled messages in send order, indexed by message ID
+
+    Behaves like the list it replaces (len, iteration, indexing, append,
+    insert at the front, remove, pop), but each message is also filed
+    under its ID together with a sequence number that orders the queue.
+    Finding a message by ID is a dict lookup and finding its position a
+    bisect over the sorted sequence keys, instead of a scan of the whole
+    queue. A watcher, if set, is told of every message that joins or
+    leaves the queue and its position.
+    """
+
+    def __init__(self, messages=(), sequences=None):
+        self.watcher = None
+        self._messages = {}  # message ID -> ScheduledMessage
+        self._sequence = {}  # message ID -> sequence number
+        self._order = []  # sorted (sequence number, message ID)
+        if sequences is None:
+            for msg in messages:
+                self.append(msg)
+        else:
+            # A saved queue keeps its sequence numbers, so storage rows
+            # keyed on them stay valid across restarts
+            for msg, sequence in zip(messages, sequences):
+                self._add(msg, sequence)
+                self._order.append((sequence, msg.id))
+            self._order.sort()
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return (self._messages[message_id] for _, message_id in self._order)
+
+    def __contains__(self, msg):
+        return msg.id in self._messages
+
+    def __getitem__(self, position):
+        return self._messages[self._order[position][1]]
+
+    def items(self):
+        """Yield (sequence number, message) in queue order"""
+        for sequence, message_id in self._order:
+            yield sequence, self._messages[message_id]
+
+    def get(self, message_id):
+        """Return the queued message with this ID, or None"""
+        return self._messages.get(message_id)
+
+    def index(self, msg):
+        """Return the queue position of msg"""
+        if msg.id not in self._messages:
+            raise ValueError(f"Message {msg.id} is not queued")
+        return bisect_left(self._order, (self._sequence[msg.id], msg.id))
+
+    def _add(self, msg, sequence):
+        if msg.id in self._messages:
+            raise ValueError(f"Message {msg.id} is already queued")
+        self._messages[msg.id] = msg
+        self._sequence[msg.id] = sequence
+
+    def append(self, msg):
+        sequence = self._order[-1][0] + 1 if self._order else 0
+        self._add(msg, sequence)
+        self._order.append((sequence, msg.id))
+        if self.watcher:
+            self.watcher.queued(msg, len(self._order) - 1)
+
+    def insert(self, position, msg):
+        """Insert msg before position; the front and back are O(1)"""
+        if position >= len(self._order):
+            self.append(msg)
+        elif position <= 0:
+            sequence = self._order[0][0] - 1
+            self._add(msg, sequence)
+            self._order.insert(0, (sequence, msg.id))
+            if self.watcher:
+                self.watcher.queued(msg, 0)
+        else:
+            message_ids = [message_id for _, message_id in self._order]
+            message_ids.insert(position, msg.id)
+            self._add(msg, position)
+            self._order = list(enumerate(message_ids))
+            self._sequence = {
+                message_id: sequence
+                for sequence, message_id in self._order
+            }
+            if self.watcher:
+                self.watcher.queued(msg, position)
+
+    def remove(self, msg):
+        position = self.index(msg)
+        del self._order[position]
+        del self._messages[msg.id]
+        del self._sequence[msg.id]
+        if self.watcher:
+            self.watcher.dequeued(msg, position)
+
+    def pop(self, position=-1):
+        msg = self[position]
+        self.remove(msg)
+        return msg
+
+    def clear(self):
+        self._messages.clear()
+        self._sequence.clear()
+        self._order.clear()
+        if self.watcher:
+            self.watcher.cleared()
+
+
+scheduled_messages = ScheduledQueue()
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def parse_hours(text):
+    """Parse "9,13,21" into a sorted list of distinct hours"""
+    hours = sorted({int(hour) for hour in text.split(",") if hour.strip()})
+    if any(hour < 0 or hour > 23 for hour in hours):
+        raise ValueError(f"Send hours must be between 0 and 23: {text!r}")
+    return hours
+
+
+def parse_rules(text):
+    """Split "key=value;key=value" into (key, value) pairs"""
+    for rule in text.split(";"):
+        if rule.strip():
+            key, _, value = rule.partition("=")
+            yield key.strip(), value
+
+
+class SlotCalendar:
+    """Generates the auto-send slots from a set of calendar rules
+
+    A slot falls on each of `hours` every day, or on a weekday's own list
+    in weekday_hours, unless it lies inside one of the blackout windows.
+    channel_hours limits a channel to the slots at its listed hours; other
+    channels get every slot. A slot at which none of `channels` posts is
+    skipped, so no auto send goes out to no channel at all.
+
+    Slots are generated lazily and kept from the first upcoming one on, so
+    asking for the n-th slot only generates as far as the queue reaches
+    and earlier answers are reused until their slots have passed.
+    """
+
+    def __init__(self,
+                 hours,
+                 weekday_hours=None,
+                 blackouts=(),
+                 channel_hours=None,
+                 channels=()):
+        self.hours = sorted(set(hours))
+        self.weekday_hours = {
+            weekday: sorted(set(day_hours))
+            for weekday, day_hours in (weekday_hours or {}).items()
+        }
+        if not any(self.hours_on_weekday(weekday) for weekday in range(7)):
+            raise ValueError("The send calendar has no hours on any day")
+        # Merged and sorted, so a slot's window is found by bisecting
+        self._blackout_starts = []
+        self._blackout_ends = []
+        for start, end in sorted(blackouts):
+            if self._blackout_ends and start <= self._blackout_ends[-1]:
+                self._blackout_ends[-1] = max(end, self._blackout_ends[-1])
+            else:
+                self._blackout_starts.append(start)
+                self._blackout_ends.append(end)
+        self.channel_hours = {
+            channel_id: set(channel_hours)
+            for channel_id, channel_hours in (channel_hours or {}).items()
+        }
+        self.channels = channels  # The live set of target channels
+        self.version = 0  # Bumped when the slots change
+        self._slots = []
+        self._upcoming = None
+
+    @classmethod
+    def from_config(cls, channels=()):
+        """Build the calendar from selected_times and the SEND_* settings"""
+        weekday_hours = {
+            WEEKDAYS.index(day.lower()[:3]): parse_hours(hours)
+            for day, hours in parse_rules(SEND_WEEKDAY_HOURS)
+        }
+        blackouts = []
+        for window in SEND_BLACKOUTS.split(";"):
+            if window.strip():
+                start, end = (cairo_tz.localize(datetime.fromisoformat(
+                    part.strip())) for part in window.split("/"))
+                blackouts.append((start, end))
+        channel_hours = {
+            int(channel_id): parse_hours(hours)
+            for channel_id, hours in parse_rules(CHANNEL_SEND_HOURS)
+        }
+        return cls(
+            parse_hours(SEND_HOURS) if SEND_HOURS else selected_times,
+            weekday_hours, blackouts, channel_hours, channels)
+
+    def hours_on_weekday(self, weekday):
+        return self.weekday_hours.get(weekday, self.hours)
+
+    def is_blacked_out(self, slot):
+        index = bisect_right(self._blackout_starts, slot) - 1
+        return index >= 0 and slot < self._blackout_ends[index]
+
+    def channel_send_hours(self):
+        """Hours at which some target channel posts, or None for every hour"""
+        if not self.channels or any(channel_id not in self.channel_hours
+                                    for channel_id in self.channels):
+            return None
+        send_hours = set().union(*(self.channel_hours[channel_id]
+                                   for channel_id in self.channels))
+        # Rather than no slots at all, ignore hours no day has
+        if not any(send_hours.intersection(self.hours_on_weekday(weekday))
+                   for weekday in range(7)):
+            logging.warning(
+                "No target channel posts at any send hour; using them all")
+            return None
+        return send_hours
+
+    def iter_slots(self, after):
+        """Yield every slot after `after`, in order"""
+        after = after.astimezone(cairo_tz)
+        day = after.date()
+        send_hours = self.channel_send_hours()
+        while True:
+            for hour in self.hours_on_weekday(day.weekday()):
+                if send_hours is not None and hour not in send_hours:
+                    continue
+                slot = cairo_tz.localize(datetime.combine(day, dtime(hour)))
+                if slot > after and not self.is_blacked_out(slot):
+                    yield slot
+            day += timedelta(days=1)
+
+    def channels_changed(self):
+        """Drop the cached slots after the target channels changed"""
+        self._slots = []
+        self.version += 1
+
+    def slot(self, position, now=None):
+        """The position-th upcoming slot, counting from 0"""
+        now = now or datetime.now(cairo_tz)
+        passed = bisect_right(self._slots, now)
+        if passed:
+            del self._slots[:passed]
+        if not self._slots:
+            self._upcoming = self.iter_slots(now)
+        while len(self._slots) <= position:
+            self._slots.append(next(self._upcoming))
+        return self._slots[position]
+
+    def slot_after(self, send_time):
+        """The first upcoming slot later than send_time"""
+        self.slot(0)
+        position = bisect_right(self._slots, send_time)
+        while self.slot(position) <= send_time:
+            position += 1
+        return self._slots[position]
+
+    def channels_for(self, send_time, channels):
+        """The channels whose cadence includes a send at send_time"""
+        if send_time is None:
+            return list(channels)
+        hour = send_time.astimezone(cairo_tz).hour
+        return [
+            channel_id for channel_id in channels
+            if hour in self.channel_hours.get(channel_id, (hour, ))
+        ]
+
+
 target_channels = {-1002554306424, -1002613672782}  # Updated channel ID
+slot_calendar = SlotCalendar.from_config(target_channels)
+
+
+def next_send_slot():
+    """Return the first upcoming auto-send slot"""
+    return slot_calendar.slot(0)
+
+
+class SlotTimeline:
+    """Send times of the queued messages, indexed by hour and by content
+
+    While auto sending runs, each message goes out at its send_time, the
+    time the slot scheduler holds for it. Otherwise the message at queue
+    position i would go out in the i-th upcoming slot of slot_calendar,
+    which is what /a assigns. The timeline watches scheduled_messages and
+    slot_scheduler and updates the hour and content indexes one message
+    at a time as messages are queued, removed or rescheduled, so slot and
+    duplicate checks are dict lookups. Only changes that move messages
+    into other slots make it reindex the whole queue on the next lookup:
+    an edit ahead of messages timed by their position, the first slot
+    passing while there are such messages, auto sending starting or
+    stopping, or the target channels changing.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._key = None
+        self._stale = True
+        # message ID -> (send time, send hour, content key, timed by position)
+        self._indexed = {}
+        self._by_position = 0  # Indexed messages timed by their position
+        self._hours = {}  # send hour -> number of messages in it
+        self._contents = {}  # (send hour, content key) -> number of messages
+
+    def _index(self, msg, position):
+        by_position = not (auto_scheduling_active and msg.send_time)
+        send_time = (slot_calendar.slot(position)
+                     if by_position else msg.send_time)
+        hour = send_time.astimezone(cairo_tz).hour
+        content = (hour, msg.content_key())
+        self._indexed[msg.id] = (send_time, hour, content, by_position)
+        self._by_position += by_position
+        self._hours[hour] = self._hours.get(hour, 0) + 1
+        self._contents[content] = self._contents.get(content, 0) + 1
+
+    def _unindex(self, msg):
+        _, hour, content, by_position = self._indexed.pop(msg.id)
+        self._by_position -= by_position
+        self._hours[hour] -= 1
+        if not self._hours[hour]:
+            del self._hours[hour]
+        self._contents[content] -= 1
+        if not self._contents[content]:
+            del self._contents[content]
+
+    def _refresh(self):
+        key = (next_send_slot(), auto_scheduling_active, slot_calendar.version)
+        if scheduled_messages is self._queue and not self._stale:
+            if key == self._key:
+                return
+            # Messages with their own send time stay where they are
+            if key[1:] == self._key[1:] and not self._by_position:
+                self._key = key
+                return
+        if self._queue is not None and self._queue.watcher is self:
+            self._queue.watcher = None
+        self._queue = scheduled_messages
+        self._queue.watcher = self
+        self._key = key
+        self._stale = False
+        self._indexed = {}
+        self._by_position = 0
+        self._hours = {}
+        self._contents = {}
+        for position, msg in enumerate(scheduled_messages):
+            self._index(msg, position)
+
+    def queued(self, msg, position):
+        """Called by the queue once msg has joined it at position"""
+        if self._stale:
+            return
+        if self._by_position and position < len(self._queue) - 1:
+            # The messages behind it that are timed by position moved
+            self._stale = True
+            return
+        self._index(msg, position)
+
+    def dequeued(self, msg, position):
+        """Called by the queue once msg, which was at position, has left"""
+        if self._stale or msg.id not in self._indexed:
+            return
+        self._unindex(msg)
+        if self._by_position and position < len(self._queue):
+            self._stale = True
+
+    def cleared(self):
+        self._stale = True
+
+    def rescheduled(self, message_id):
+        """Called by the slot scheduler when a message gets a send time
+
+        Cancelling a send leaves the message's send_time, and a message
+        that is sent or removed leaves the queue, so this is the only
+        scheduler change that moves a message in the indexes.
+        """
+        if self._stale or self._queue is None:
+            return
+        msg = self._queue.get(message_id)
+        if msg is None or not (auto_scheduling_active and msg.send_time):
+            return
+        send_time, _, _, by_position = self._indexed[msg.id]
+        if by_position or send_time != msg.send_time:
+            self._unindex(msg)
+            self._index(msg, None)
+
+    def entries(self):
+        """(send time, queue position, message) in the order they send"""
+        self._refresh()
+        entries = [(self._indexed[msg.id][0], position, msg)
+                   for position, msg in enumerate(self._queue)]
+        if auto_scheduling_active:
+            entries.sort(key=lambda entry: entry[:2])
+        return entries
+
+    def slot(self, position):
+        """Send time of the message at this queue position"""
+        return slot_calendar.slot(position)
+
+    def hour_taken(self, hour):
+        self._refresh()
+        return hour in self._hours
+
+    def has_duplicate(self, msg, hour):
+        """Whether a message with the same content sends in this hour"""
+        self._refresh()
+        return (hour, msg.content_key()) in self._contents
+
+
+slot_timeline = SlotTimeline()
 auto_scheduling_active = False
 media_group_buffer = {}
 
@@ -512,10 +1860,15 @@ def get_main_menu():
     return InlineKeyboardMarkup(keyboard)
 
 
+# Navigation markup never changes, so it is built once and shared
+NAVIGATION_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("📚 Menu", callback_data="show_menu")]])
+NAVIGATION_TEXT = "📚 Open the menu below:"
+
+
 def get_navigation_buttons():
     """Get navigation buttons for subscriber messages"""
-    keyboard = [[InlineKeyboardButton("📚 Menu", callback_data="show_menu")]]
-    return InlineKeyboardMarkup(keyboard)
+    return NAVIGATION_MARKUP
 
 
 # Command handlers
@@ -640,33 +1993,21 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(menu_text, reply_markup=get_main_menu())
 
 
-async def show_top_posts_page(context_object, page=0, is_edit=False):
-    """Unified function to show top posts with pagination"""
-    # Reload top posts from file to ensure consistency
-    load_top_posts()
+TOP_POSTS_PER_PAGE = 10
 
-    if not top_posts:
-        message_text = ("📭 No top posts available yet.\n"
-                        "Admins haven't marked any posts as TOP.")
-        reply_markup = get_navigation_buttons()
 
-        if is_edit:
-            await context_object.edit_message_text(message_text,
-                                                   reply_markup=reply_markup)
-        else:
-            await context_object.reply_text(message_text,
-                                            reply_markup=reply_markup)
-        return
+@functools.lru_cache(maxsize=32)
+def render_top_posts_page(version, page):
+    """Build the text and keyboard of a TOP page
 
-    # Pagination settings
-    posts_per_page = 10
-    total_pages = (len(top_posts) + posts_per_page - 1) // posts_per_page
-
-    # Ensure page is within valid range
-    page = max(0, min(page, total_pages - 1))
+    Cached by top_posts_version, so page flips reuse the markup until the
+    top posts change. page must be a valid page number.
+    """
+    total_pages = (len(top_posts) + TOP_POSTS_PER_PAGE -
+                   1) // TOP_POSTS_PER_PAGE
 
-    start_idx = page * posts_per_page
-    end_idx = min(start_idx + posts_per_page, len(top_posts))
+    start_idx = page * TOP_POSTS_PER_PAGE
+    end_idx = min(start_idx + TOP_POSTS_PER_PAGE, len(top_posts))
 
     # Create buttons for current page posts
     keyboard = []
@@ -711,7 +2052,33 @@ async def show_top_posts_page(context_object, page=0, is_edit=False):
     message_text = (
         f"🔥 TOP Posts (Page {page + 1}/{total_pages}):\n\n"
         f"📝 Showing {end_idx - start_idx} of {len(top_posts)} posts")
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return message_text, InlineKeyboardMarkup(keyboard)
+
+
+async def show_top_posts_page(context_object, page=0, is_edit=False):
+    """Unified function to show top posts with pagination"""
+    # Served from memory; this only reads storage if it changed outside
+    # the bot
+    await refresh_top_posts()
+
+    if not top_posts:
+        message_text = ("📭 No top posts available yet.\n"
+                        "Admins haven't marked any posts as TOP.")
+        reply_markup = get_navigation_buttons()
+
+        if is_edit:
+            await context_object.edit_message_text(message_text,
+                                                   reply_markup=reply_markup)
+        else:
+            await context_object.reply_text(message_text,
+                                            reply_markup=reply_markup)
+        return
+
+    # Ensure page is within valid range
+    total_pages = (len(top_posts) + TOP_POSTS_PER_PAGE -
+                   1) // TOP_POSTS_PER_PAGE
+    page = max(0, min(page, total_pages - 1))
+    message_text, reply_markup = render_top_posts_page(top_posts_version, page)
 
     if is_edit:
         await context_object.edit_message_text(message_text,
@@ -737,6 +2104,11 @@ async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_top_posts_page(update.message, page=0, is_edit=False)
 
 
+def format_subscriber_export(user_ids):
+    """Return the export file content for the IDs, one ID per line"""
+    return "\n".join(str(sub_id) for sub_id in user_ids).encode()
+
+
 async def subs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show subscriber count and export IDs to file (admin only)"""
     user_id = update.effective_user.id
@@ -754,31 +2126,21 @@ async def subs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        # Sort subscriber IDs for consistent display
-        sorted_subscribers = sorted(list(subscribers))
-
-        # Create file with subscriber IDs
-        file_content = "\n".join(str(sub_id) for sub_id in sorted_subscribers)
-
-        # Write to temporary file
-        filename = "subscriber_ids.txt"
-        with open(filename, 'w') as f:
-            f.write(file_content)
+        # The store is already sorted; render the file off the event loop
+        sorted_subscribers = subscribers.snapshot()
+        file_content = await persistence_io.run(format_subscriber_export,
+                                                sorted_subscribers)
 
         # Send the file to admin
-        with open(filename, 'rb') as f:
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=f,
-                filename=filename,
-                caption=f"📊 Subscriber Database Export\n\n"
-                f"👥 Total subscribers: {len(subscribers)}\n"
-                f"📁 File contains: {len(sorted_subscribers)} subscriber IDs\n"
-                f"📅 Exported at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-
-        # Clean up the temporary file
-        os.remove(filename)
+        filename = "subscriber_ids.txt"
+        await context.bot.send_document(
+            chat_id=user_id,
+            document=file_content,
+            filename=filename,
+            caption=f"📊 Subscriber Database Export\n\n"
+            f"👥 Total subscribers: {len(subscribers)}\n"
+            f"📁 File contains: {len(sorted_subscribers)} subscriber IDs\n"
+            f"📅 Exported at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
         logging.info(
             f"Admin {user_id} exported {len(subscribers)} subscriber IDs to file"
@@ -827,8 +2189,8 @@ async def remove_top_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "⛔ Sorry, only the admin can use this command.")
         return
 
-    # Reload top posts to ensure consistency
-    load_top_posts()
+    # Pick up changes made to storage outside the bot
+    await refresh_top_posts()
 
     # If replying to a message, remove it from top posts
     if update.message.reply_to_message:
@@ -858,7 +2220,7 @@ async def remove_top_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 removed_count += 1
 
         if removed_count > 0:
-            save_top_posts()
+            top_posts_changed()
             await update.message.reply_text(
                 f"✅ Removed {removed_count} matching post(s) from TOP! Total remaining: {len(top_posts)}"
             )
@@ -873,7 +2235,7 @@ async def remove_top_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
             post_index = int(context.args[0]) - 1  # Convert to 0-based index
             if 0 <= post_index < len(top_posts):
                 removed_post = top_posts.pop(post_index)
-                save_top_posts()
+                top_posts_changed()
                 await update.message.reply_text(
                     f"✅ Removed TOP post #{post_index + 1}! Total remaining: {len(top_posts)}"
                 )
@@ -1004,29 +2366,12 @@ async def show_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     messages_list = "📋 Scheduled Messages:\n\n"
-    egypt_tz = pytz.timezone('Africa/Cairo')
-    current_time = datetime.now(egypt_tz)
 
-    # Calculate next odd hour
-    current_hour = current_time.hour
-    if current_hour % 2 == 0:
-        next_odd_hour = current_hour + 1
-    else:
-        next_odd_hour = current_hour + 2
-
-    if next_odd_hour >= 24:
-        next_odd_hour = 1
-        next_send_time = current_time.replace(
-            hour=next_odd_hour, minute=0, second=0) + timedelta(days=1)
-    else:
-        next_send_time = current_time.replace(hour=next_odd_hour,
-                                              minute=0,
-                                              second=0)
-
-    for idx, msg in enumerate(scheduled_messages, 1):
-        # Calculate this message's send time
-        msg_send_time = next_send_time + timedelta(hours=2 * (idx - 1))
-        time_str = msg_send_time.strftime("%Y-%m-%d %I:%M %p")
+    # Listed in send order; the numbers stay queue positions for /r and /show
+    for msg_send_time, position, msg in slot_timeline.entries():
+        idx = position + 1
+        time_str = msg_send_time.astimezone(cairo_tz).strftime(
+            "%Y-%m-%d %I:%M %p")
 
         # Get content
         content = msg.text
@@ -1069,6 +2414,7 @@ async def auto_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         auto_scheduling_active = True
+        persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
         # Schedule all messages for their calculated times
         await schedule_all_messages(context)
@@ -1088,6 +2434,7 @@ async def auto_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "⚠️ Error starting scheduler. Please try again.")
         auto_scheduling_active = False
+        persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
 
 async def auto_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1108,13 +2455,11 @@ async def auto_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     auto_scheduling_active = False
+    persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
-    # Clear all auto-send jobs
-    jobs_cleared = 0
-    for job in context.job_queue.jobs():
-        if job.name and job.name.startswith("auto_send_message_"):
-            job.schedule_removal()
-            jobs_cleared += 1
+    # Clear all pending auto sends
+    jobs_cleared = len(slot_scheduler)
+    slot_scheduler.clear()
 
     await update.message.reply_text(
         f"🛑 Automatic message scheduling has been stopped!\n"
@@ -1181,8 +2526,8 @@ async def mark_as_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "⚠️ Please reply to a message to mark it as TOP")
         return
 
-    # Reload top posts to ensure consistency
-    load_top_posts()
+    # Pick up changes made to storage outside the bot
+    await refresh_top_posts()
 
     reply = update.message.reply_to_message
     top_msg = ScheduledMessage()
@@ -1208,7 +2553,7 @@ async def mark_as_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
     top_posts.append(top_msg)
-    save_top_posts()
+    top_posts_changed()
     await update.message.reply_text(
         f"🔥 Message marked as TOP! Total top posts: {len(top_posts)}")
 
@@ -1228,9 +2573,162 @@ async def verify_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"✅ Verified! You are the admin (ID: {user_id})")
 
 
-def is_trigger_already_scheduled(job_queue):
-    """Check if an auto_send_command job is already scheduled"""
-    return any(job.name == "auto_send_command" for job in job_queue.jobs())
+class SlotScheduler:
+    """Sends queued messages at their send times from a single timer
+
+    Send times sit in a min-heap of (send_time, message_id) with one
+    JobQueue job armed for the earliest, so scheduling, cancelling or
+    moving a message is O(log n) and APScheduler holds one timer however
+    long the queue is. Cancelled and moved entries stay in the heap and are
+    skipped when they reach the top.
+    """
+
+    JOB_NAME = "auto_send_slot_timer"
+
+    def __init__(self, watcher=None):
+        self.job_queue = None  # Set once the application is built
+        self._heap = []
+        self._send_times = {}  # message ID -> its current send time
+        self._job = None
+        self._armed_for = None
+        self._sending = False
+        self.watcher = watcher
+
+    def __len__(self):
+        return len(self._send_times)
+
+    def __contains__(self, message_id):
+        return message_id in self._send_times
+
+    def latest(self):
+        """The latest send time scheduled, or None"""
+        return max(self._send_times.values(), default=None)
+
+    def schedule(self, message_id, send_time):
+        """Schedule a message's send, or move it to a new time"""
+        self._send_times[message_id] = send_time
+        heapq.heappush(self._heap, (send_time, message_id))
+        if self.watcher:
+            self.watcher.rescheduled(message_id)
+        self._arm()
+
+    def cancel(self, message_id):
+        if self._send_times.pop(message_id, None) is None:
+            return
+        # Rebuild once stale entries outnumber live ones
+        if len(self._heap) > 2 * len(self._send_times) + 64:
+            self._heap = [(send_time, queued_id)
+                          for send_time, queued_id in self._heap
+                          if self._send_times.get(queued_id) == send_time]
+            heapq.heapify(self._heap)
+
+    def clear(self):
+        self._heap.clear()
+        self._send_times.clear()
+        if self._job:
+            self._job.schedule_removal()
+        self._job = None
+        self._armed_for = None
+
+    def _next(self):
+        """Drop stale entries off the top and return the earliest live one"""
+        while self._heap:
+            send_time, message_id = self._heap[0]
+            if self._send_times.get(message_id) == send_time:
+                return send_time, message_id
+            heapq.heappop(self._heap)
+        return None
+
+    def _arm(self):
+        entry = self._next()
+        # While sending, _wake re-arms once it is done
+        if entry is None or self.job_queue is None or self._sending:
+            return
+        if self._armed_for is not None and self._armed_for <= entry[0]:
+            return
+        if self._job:
+            self._job.schedule_removal()
+        self._armed_for = entry[0]
+        # A delay rather than a date, so an overdue send still runs instead
+        # of being dropped as a misfire
+        delay = max(0, (entry[0] - datetime.now(cairo_tz)).total_seconds())
+        self._job = self.job_queue.run_once(self._wake,
+                                            when=delay,
+                                            name=self.JOB_NAME)
+
+    async def _wake(self, context: ContextTypes.DEFAULT_TYPE):
+        self._job = None
+        self._armed_for = None
+        self._sending = True
+        try:
+            # Due messages go out one after another, in send time order
+            while True:
+                entry = self._next()
+                if entry is None or entry[0] > datetime.now(cairo_tz):
+                    break
+                heapq.heappop(self._heap)
+                del self._send_times[entry[1]]
+                await send_scheduled_message_auto(context, entry[1])
+        finally:
+            self._sending = False
+            self._arm()
+
+
+slot_scheduler = SlotScheduler(watcher=slot_timeline)
+
+
+def queue_slot(position):
+    """Send time for a message joining the queue at position
+
+    While auto sending runs, queued messages keep the times they were
+    given, and a removal leaves the slot of the removed position to a
+    message that already holds a later one. A new message then goes in the
+    first slot after the latest scheduled time instead.
+    """
+    latest = slot_scheduler.latest() if auto_scheduling_active else None
+    if latest is not None:
+        return slot_calendar.slot_after(latest)
+    return slot_timeline.slot(position)
+
+
+def schedule_queued_message(scheduled_msg):
+    """Give a newly queued message its slot if auto sending is running"""
+    if auto_scheduling_active and scheduled_msg.send_time:
+        slot_scheduler.schedule(scheduled_msg.id, scheduled_msg.send_time)
+
+
+def rehydrate_schedule():
+    """Put an active auto schedule back on the timer after a restart
+
+    Every message keeps the send time it was given, so no slot moves and
+    nothing is fetched from Telegram. Messages whose time passed while the
+    bot was down, or that never had one, take the first upcoming slots no
+    other message holds, in queue order.
+    """
+    if not auto_scheduling_active or not scheduled_messages:
+        return
+
+    now = datetime.now(cairo_tz)
+    held = {
+        msg.send_time
+        for msg in scheduled_messages
+        if msg.send_time and msg.send_time > now
+    }
+    position = 0
+    moved = 0
+    for msg in scheduled_messages:
+        if not msg.send_time or msg.send_time <= now:
+            while slot_calendar.slot(position) in held:
+                position += 1
+            msg.send_time = slot_calendar.slot(position)
+            position += 1
+            moved += 1
+        slot_scheduler.schedule(msg.id, msg.send_time)
+    if moved:
+        persistence.save_now(SCHEDULED_MESSAGES_FILE)
+    logging.info(
+        f"Restored the auto schedule of {len(scheduled_messages)} messages, "
+        f"{moved} moved to new slots")
 
 
 async def schedule_all_messages(context: ContextTypes.DEFAULT_TYPE):
@@ -1238,44 +2736,19 @@ async def schedule_all_messages(context: ContextTypes.DEFAULT_TYPE):
     if not auto_scheduling_active or not scheduled_messages:
         return
 
-    # Clear any existing auto jobs
-    for job in context.job_queue.jobs():
-        if job.name and job.name.startswith("auto_send_message_"):
-            job.schedule_removal()
+    slot_scheduler.clear()
 
-    current_time = datetime.now(cairo_tz)
-    next_odd_hour = current_time.hour + (1 if current_time.hour %
-                                         2 == 0 else 2)
-
-    if next_odd_hour >= 24:
-        next_odd_hour = 1
-        next_send_time = current_time.replace(
-            hour=next_odd_hour, minute=0, second=0,
-            microsecond=0) + timedelta(days=1)
-    else:
-        next_send_time = current_time.replace(hour=next_odd_hour,
-                                              minute=0,
-                                              second=0,
-                                              microsecond=0)
+    next_send_time = next_send_slot()
 
     # Schedule each message for its calculated time
     for idx, scheduled_msg in enumerate(scheduled_messages):
-        msg_send_time = next_send_time + timedelta(hours=2 * idx)
+        msg_send_time = slot_calendar.slot(idx)
         scheduled_msg.send_time = msg_send_time  # Store send time
-        delay = (msg_send_time - current_time).total_seconds()
-
-        if delay > 0:  # Only schedule future messages
-            context.job_queue.run_once(
-                send_scheduled_message_auto,
-                when=delay,
-                data={
-                    "message_index": idx,
-                    "message_id": id(scheduled_msg)
-                },
-                name=f"auto_send_message_{idx}_{id(scheduled_msg)}")
-            logging.info(
-                f"Message {idx+1} scheduled for {msg_send_time.strftime('%Y-%m-%d %H:%M:%S')} Cairo time"
-            )
+        slot_scheduler.schedule(scheduled_msg.id, msg_send_time)
+    persistence.save_now(SCHEDULED_MESSAGES_FILE)
+    logging.info(
+        f"Scheduled {len(scheduled_messages)} messages from {next_send_time.strftime('%Y-%m-%d %H:%M:%S')} Cairo time"
+    )
 
 
 async def schedule_next_message(context: ContextTypes.DEFAULT_TYPE):
@@ -1342,57 +2815,8 @@ async def handle_callback_query(update: Update,
                 await query.answer("📤 Sending selected top post...")
 
                 # Send the selected top post
-                if selected_post.text and not selected_post.media:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=selected_post.text,
-                        entities=selected_post.entities,
-                        reply_markup=get_navigation_buttons())
-                elif selected_post.media:
-                    if len(selected_post.media) == 1:
-                        media = selected_post.media[0]
-                        if media['type'] == 'photo':
-                            await context.bot.send_photo(
-                                chat_id=user_id,
-                                photo=media['file_id'],
-                                caption=media['caption'],
-                                caption_entities=media['caption_entities'],
-                                reply_markup=get_navigation_buttons())
-                        elif media['type'] == 'video':
-                            await context.bot.send_video(
-                                chat_id=user_id,
-                                video=media['file_id'],
-                                caption=media['caption'],
-                                caption_entities=media['caption_entities'],
-                                reply_markup=get_navigation_buttons())
-                    else:
-                        # Media group
-                        media_group = []
-                        for idx, media in enumerate(selected_post.media):
-                            if media['type'] == 'photo':
-                                media_group.append(
-                                    InputMediaPhoto(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                            elif media['type'] == 'video':
-                                media_group.append(
-                                    InputMediaVideo(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                        if media_group:
-                            await context.bot.send_media_group(
-                                chat_id=user_id, media=media_group)
-                            # Send navigation buttons after media group
-                            await context.bot.send_message(
-                                chat_id=user_id,
-                                text="",
-                                reply_markup=get_navigation_buttons())
+                await selected_post.payload().send_to_user(
+                    context.bot, user_id, protect_content=False)
             else:
                 await query.answer("❌ Invalid post selection")
         except Exception as e:
@@ -1491,12 +2915,12 @@ async def handle_callback_query(update: Update,
         # Remove from failed subscribers
         if sub_id_to_delete in failed_subscribers:
             del failed_subscribers[sub_id_to_delete]
-            save_failed_subscribers()
+            save_failed_subscribers(removed=[sub_id_to_delete])
 
         # Remove from main subscribers
         try:
             subscribers.discard(int(sub_id_to_delete))
-            save_subscribers()
+            save_subscribers(removed=[int(sub_id_to_delete)])
         except:
             pass
 
@@ -1511,151 +2935,865 @@ async def handle_callback_query(update: Update,
             return
 
         failed_subscribers.clear()
-        save_failed_subscribers()
+        persistence.mark_dirty(FAILED_SUBSCRIBERS_FILE)
 
         await query.answer("✅ All failed subscribers cleared")
         await query.edit_message_text(
             "✅ All failed subscriber records have been cleared.")
 
 
-async def send_scheduled_message_auto(context: ContextTypes.DEFAULT_TYPE):
+# Chat metadata cache
+class ChatInfoCache:
+    """TTL cache for chat details and the bot's membership in each chat
+
+    Posting to a channel first checks that the bot is still an admin there;
+    caching those lookups keeps two API calls per channel off every post.
+    Entries expire after the TTL and are dropped early through invalidate(),
+    which runs whenever Telegram reports a change to the bot's membership.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._chats = {}
+        self._members = {}
+
+    def _lookup(self, entries, chat_id):
+        entry = entries.get(chat_id)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def get_chat(self, bot, chat_id):
+        chat = self._lookup(self._chats, chat_id)
+        if chat is None:
+            chat = await bot.get_chat(chat_id)
+            self._chats[chat_id] = (time.monotonic(), chat)
+        return chat
+
+    async def get_bot_member(self, bot, chat_id):
+        member = self._lookup(self._members, chat_id)
+        if member is None:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=bot.id)
+            self._members[chat_id] = (time.monotonic(), member)
+        return member
+
+    async def is_bot_admin(self, bot, chat_id):
+        member = await self.get_bot_member(bot, chat_id)
+        return member.status in ['administrator', 'creator']
+
+    def invalidate(self, chat_id=None):
+        """Forget one chat, or every chat when none is given"""
+        if chat_id is None:
+            self._chats.clear()
+            self._members.clear()
+        else:
+            self._chats.pop(chat_id, None)
+            self._members.pop(chat_id, None)
+
+
+chat_cache = ChatInfoCache(CHAT_CACHE_TTL)
+
+
+async def handle_my_chat_member(update: Update,
+                                context: ContextTypes.DEFAULT_TYPE):
+    """Drop cached details when the bot is promoted, demoted or removed"""
+    change = update.my_chat_member
+    chat_cache.invalidate(change.chat.id)
+    logging.info(
+        f"Bot status in chat {change.chat.id} changed from "
+        f"{change.old_chat_member.status} to {change.new_chat_member.status}")
+
+
+# Broadcast engine
+class TokenBucket:
+    """Async token bucket that paces API calls to a steady rate"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        """Wait until the requested number of tokens is available"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the given number of seconds"""
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+global_rate_limiter = TokenBucket(BROADCAST_RATE_LIMIT)
+
+
+class AIMDController:
+    """Adapts fan-out concurrency and the global send rate to Telegram
+
+    Additive increase, multiplicative decrease: every successful send grows
+    the sender limit and the rate of the token bucket a little (about one
+    step per round of sends), a flood wait or timeout cuts both by
+    BROADCAST_BACKOFF_FACTOR. Signals that arrive while the previous cut is
+    still in effect are ignored, so a burst of 429s from requests that were
+    already in flight only counts once.
+    """
+
+    def __init__(self,
+                 limiter,
+                 concurrency=BROADCAST_CONCURRENCY,
+                 max_concurrency=BROADCAST_MAX_CONCURRENCY,
+                 min_rate=BROADCAST_MIN_RATE,
+                 max_rate=BROADCAST_MAX_RATE):
+        self.limiter = limiter
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(min(max(1, concurrency), self.max_concurrency))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._hold_until = 0.0
+        self._in_flight = 0
+        self._slots = asyncio.Condition()
+
+    @property
+    def workers(self):
+        return int(self.limit)
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def on_success(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self.limiter.rate = min(self.max_rate,
+                                self.limiter.rate + 1 / self.limiter.rate)
+
+    def on_congestion(self, hold=1.0):
+        """Back off after a flood wait or timeout"""
+        now = time.monotonic()
+        if now < self._hold_until:
+            return
+        self._hold_until = now + max(hold, 1.0)
+        self.limit = max(1.0, self.limit * BROADCAST_BACKOFF_FACTOR)
+        self.limiter.rate = max(self.min_rate,
+                                self.limiter.rate * BROADCAST_BACKOFF_FACTOR)
+        logging.warning(
+            f"Broadcast backing off to {self.workers} senders at "
+            f"{self.rate:.1f} msg/s")
+
+    async def acquire(self):
+        """Wait for a sender slot under the current limit"""
+        async with self._slots:
+            await self._slots.wait_for(
+                lambda: self._in_flight < self.workers)
+            self._in_flight += 1
+
+    async def release(self):
+        async with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+
+broadcast_controller = AIMDController(global_rate_limiter)
+
+
+def retry_after_seconds(error):
+    """Flood wait of a RetryAfter error in seconds
+
+    Newer python-telegram-bot versions report it as a timedelta.
+    """
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class ChatRateLimiter:
+    """Keeps consecutive messages to the same chat a minimum interval apart"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next_slot = {}
+        self._prune_at = 1024
+
+    async def acquire(self, chat_id):
+        """Reserve the next free slot for this chat and wait for it"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0))
+        self._next_slot[chat_id] = slot + self.interval
+
+        # Forget chats whose interval has already passed
+        if len(self._next_slot) > self._prune_at:
+            self._next_slot = {
+                cid: next_slot
+                for cid, next_slot in self._next_slot.items()
+                if next_slot > now
+            }
+            self._prune_at = max(1024, 2 * len(self._next_slot))
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class FloodControlLimiter(BaseRateLimiter):
+    """Rate limiter installed on the bot to respect Telegram flood limits
+
+    Every outgoing message goes through a per-chat limiter (private chats
+    and groups/channels have different limits) and the shared global
+    limiter. When Telegram answers with RetryAfter, all sends are paused
+    for the requested time and the request is retried instead of failed.
+    """
+
+    MESSAGE_ENDPOINT_PREFIXES = ("send", "copy", "forward")
+
+    def __init__(self,
+                 global_limiter,
+                 controller=None,
+                 max_retries=FLOOD_MAX_RETRIES):
+        self.global_limiter = global_limiter
+        self.controller = controller
+        self.private_limiter = ChatRateLimiter(PRIVATE_CHAT_INTERVAL)
+        self.group_limiter = ChatRateLimiter(GROUP_CHAT_INTERVAL)
+        self.max_retries = max_retries
+        self._paused_until = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_limiter(self, chat_id):
+        if chat_id in target_channels or (isinstance(chat_id, int)
+                                          and chat_id < 0):
+            return self.group_limiter
+        return self.private_limiter
+
+    async def _wait_for_flood_pause(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data,
+                              rate_limit_args):
+        chat_id = data.get("chat_id")
+        is_message = endpoint.startswith(self.MESSAGE_ENDPOINT_PREFIXES)
+        attempt = 0
+
+        while True:
+            if is_message:
+                if chat_id is not None:
+                    await self._chat_limiter(chat_id).acquire(chat_id)
+                await self.global_limiter.acquire()
+            # Checked last so requests already queued in the limiters
+            # also respect a flood wait that started while they waited
+            await self._wait_for_flood_pause()
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                # Flood waits apply to the whole bot, so hold every sender back
+                retry_after = retry_after_seconds(e)
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + retry_after)
+                self.global_limiter.pause(retry_after)
+                if self.controller:
+                    self.controller.on_congestion(retry_after)
+                logging.warning(
+                    f"Flood control on {endpoint} for chat {chat_id}: "
+                    f"retrying in {retry_after}s (attempt {attempt}/{self.max_retries})"
+                )
+
+
+def get_primary_channel():
+    """Channel whose post subscribers receive copies of in copy mode"""
+    if REQUIRED_CHANNEL_ID in target_channels:
+        return REQUIRED_CHANNEL_ID
+    return min(target_channels) if target_channels else None
+
+
+class ChannelResult:
+    """Outcome of posting a message to one channel"""
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.title = None
+        self.message_ids = None
+        self.error = None
+        self.not_admin = False
+        self.attempts = 0
+
+    @property
+    def ok(self):
+        return self.message_ids is not None
+
+    @property
+    def name(self):
+        if self.title:
+            return f"{self.title} ({self.channel_id})"
+        return str(self.channel_id)
+
+
+async def post_to_channel(bot, payload, channel_id, check_admin=False):
+    """Post a payload to one channel with its own retry and backoff
+
+    Never raises; the outcome is reported in the returned ChannelResult so a
+    broken channel can't affect the others.
+    """
+    result = ChannelResult(channel_id)
+    for attempt in range(1, CHANNEL_SEND_RETRIES + 1):
+        result.attempts = attempt
+        try:
+            if check_admin:
+                # Check if the bot has admin rights in the channel
+                chat = await chat_cache.get_chat(bot, channel_id)
+                result.title = chat.title
+                if not await chat_cache.is_bot_admin(bot, channel_id):
+                    result.not_admin = True
+                    result.error = "Bot is not admin in this channel"
+                    logging.warning(
+                        f"Bot is not admin in channel {result.name}. Skipping..."
+                    )
+                    return result
+
+            posted = await payload.send_to_channel(bot, channel_id)
+            result.message_ids = [message.message_id for message in posted]
+            result.error = None
+            return result
+        except (BadRequest, Forbidden) as e:
+            # Retrying won't fix a rejected request or a missing permission,
+            # but the cached rights for this channel can't be trusted now
+            chat_cache.invalidate(channel_id)
+            result.error = str(e)
+            break
+        except Exception as e:
+            result.error = str(e)
+            if attempt < CHANNEL_SEND_RETRIES:
+                delay = CHANNEL_RETRY_DELAY * 2**(attempt - 1)
+                logging.warning(
+                    f"Attempt {attempt} to send to channel {channel_id} failed: {e}. "
+                    f"Retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    logging.error(
+        f"Failed to send message to channel {result.name}: {result.error}")
+    return result
+
+
+class ChannelDelivery:
+    """Posts a payload to several channels concurrently
+
+    Every channel runs in its own task, so a slow or broken channel holds up
+    neither the other channels nor the subscriber fan-out. Successful posts
+    are recorded in the posted dict (channel_id -> message IDs); channels
+    already in it are skipped.
+    """
+
+    def __init__(self,
+                 bot,
+                 payload,
+                 channels,
+                 check_admin=False,
+                 posted=None,
+                 on_posted=None):
+        self.payload = payload
+        self.posted = posted if posted is not None else {}
+        self._on_posted = on_posted
+        self._tasks = {
+            channel_id:
+            asyncio.create_task(self._post(bot, channel_id, check_admin))
+            for channel_id in channels if channel_id not in self.posted
+        }
+
+    async def _post(self, bot, channel_id, check_admin):
+        result = await post_to_channel(bot, self.payload, channel_id,
+                                       check_admin)
+        if result.ok:
+            self.posted[channel_id] = result.message_ids
+            if self._on_posted:
+                self._on_posted(result)
+        return result
+
+    async def first_success(self):
+        """Wait until any channel has the post; False if none succeed"""
+        if self.posted:
+            return True
+        pending = set(self._tasks.values())
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.result().ok for task in done):
+                return True
+        return False
+
+    async def subscriber_source(self):
+        """Wait until subscribers can be sent to and return what they get
+
+        Subscribers only receive posts that reached at least one channel, so
+        this returns None when every channel failed. In copy mode it waits
+        for the primary channel and copies its post; if that post failed the
+        payload is sent directly instead.
+        """
+        if BROADCAST_MODE == "copy":
+            primary_channel = get_primary_channel()
+            task = self._tasks.get(primary_channel)
+            if task:
+                await task
+            if primary_channel in self.posted:
+                return ChannelPostCopy(primary_channel,
+                                       self.posted[primary_channel])
+            logging.warning(
+                f"No post in primary channel {primary_channel}, sending the message body instead"
+            )
+        return self.payload if await self.first_success() else None
+
+    async def results(self):
+        """Wait for every channel and return their ChannelResults"""
+        return list(await asyncio.gather(*self._tasks.values()))
+
+
+async def broadcast_to_subscribers(deliver,
+                                   recipients,
+                                   controller=None,
+                                   progress=None):
+    """Fan a message out to recipients using a pool of concurrent senders
+
+    deliver(chat_id) performs the API call(s) for a single recipient. Rate
+    limiting happens in the bot's FloodControlLimiter; the AIMDController
+    decides how many senders may have a request in flight and tunes the
+    global rate from the outcomes. Recipients that are still throttled
+    after the limiter's retries are re-queued instead of being counted as
+    failed. If a BroadcastRecord is passed as progress, every dispatch and
+    outcome is recorded in the broadcast journal. Returns
+    (sent_count, failed_ids).
+    """
+    # Recipients are a list or a subscribers.snapshot(), neither of which
+    # new subscribers modify, so there is no need to copy them
+    pending = iter(recipients)
+    throttled = deque()
+    requeues = {}
+    sent_count = 0
+    failed_ids = []
+
+    def next_recipient():
+        if throttled:
+            return throttled.popleft()
+        chat_id = next(pending, None)
+        if chat_id is not None and progress:
+            progress.mark_dispatched(chat_id)
+        return chat_id
+
+    async def send_one(chat_id):
+        nonlocal sent_count
+        try:
+            await deliver(chat_id)
+            sent_count += 1
+            controller.on_success()
+            if progress:
+                progress.mark_settled(chat_id, delivered=True)
+        except RetryAfter as e:
+            attempts = requeues.get(chat_id, 0) + 1
+            if attempts > BROADCAST_MAX_REQUEUES:
+                logging.warning(
+                    f"Giving up on subscriber {chat_id} after {attempts} flood waits"
+                )
+                failed_ids.append(chat_id)
+                if progress:
+                    progress.mark_settled(chat_id, delivered=False)
+                return
+            requeues[chat_id] = attempts
+            throttled.append(chat_id)
+            logging.info(
+                f"Re-queued subscriber {chat_id} after flood wait: {e}")
+        except Exception as e:
+            if isinstance(e, TimedOut):
+                controller.on_congestion()
+            failed_ids.append(chat_id)
+            if progress:
+                progress.mark_settled(chat_id, delivered=False)
+            logging.error(f"Failed to send to subscriber {chat_id}: {e}")
+
+    async def sender():
+        # All senders pull from the same source, so each recipient is
+        # handed out exactly once
+        while True:
+            await controller.acquire()
+            try:
+                chat_id = next_recipient()
+                if chat_id is None:
+                    return
+                await send_one(chat_id)
+            finally:
+                await controller.release()
+
+    controller = controller or broadcast_controller
+    started = time.monotonic()
+    await asyncio.gather(*(sender()
+                           for _ in range(controller.max_concurrency)))
+    elapsed = time.monotonic() - started
+    logging.info(
+        f"Broadcast finished: {sent_count} sent, {len(failed_ids)} failed "
+        f"in {elapsed:.1f}s, ending at {controller.workers} senders and "
+        f"{controller.rate:.1f} msg/s")
+    return sent_count, failed_ids
+
+
+class BroadcastRecord:
+    """Progress of one broadcast as stored in the broadcast journal
+
+    Subscribers are sent to in ascending ID order. Every subscriber ID up to
+    and including the cursor is settled: delivered, unless it is listed in
+    failed. IDs above the cursor are delivered if they are in
+    delivered_ahead, failed if they are in failed, and pending otherwise.
+    """
+
+    def __init__(self, journal, broadcast_id, message, source):
+        self.journal = journal
+        self.broadcast_id = broadcast_id
+        self.message = message
+        self.source = source
+        self.started_at = datetime.now(cairo_tz)
+        self.channel_posts = {}  # channel_id -> IDs of the posted messages
+        self.channels_done = False
+        self.cursor = None
+        self.delivered_count = 0
+        self.delivered_ahead = set()
+        self.failed = set()
+        self._new_failures = []  # Failed since the last save
+        self._in_flight = deque()
+        self._unsaved = 0
+        # The message doesn't change once journaled, so encode it once
+        self._message_data = message.to_dict()
+
+    def mark_dispatched(self, chat_id):
+        self._in_flight.append(chat_id)
+
+    def mark_settled(self, chat_id, delivered):
+        if delivered:
+            self.delivered_count += 1
+            self.delivered_ahead.add(chat_id)
+        else:
+            self.failed.add(chat_id)
+            self._new_failures.append(chat_id)
+
+        # Move the cursor past every leading subscriber that is settled
+        while self._in_flight and (self._in_flight[0] in self.delivered_ahead
+                                   or self._in_flight[0] in self.failed):
+            self.cursor = self._in_flight.popleft()
+            self.delivered_ahead.discard(self.cursor)
+
+        self._unsaved += 1
+        if self._unsaved >= BROADCAST_JOURNAL_FLUSH_EVERY:
+            self.journal.save()
+
+    def pending_recipients(self, current_subscribers):
+        """Subscribers that have not been sent this broadcast yet, in order
+
+        current_subscribers must be sorted, e.g. subscribers.snapshot().
+        """
+        start = 0
+        if self.cursor is not None:
+            start = bisect_right(current_subscribers, self.cursor)
+        return [
+            chat_id for chat_id in current_subscribers[start:]
+            if chat_id not in self.delivered_ahead
+            and chat_id not in self.failed
+        ]
+
+    def take_new_failures(self):
+        """Return the failures since the last call, for the failure log"""
+        failures, self._new_failures = self._new_failures, []
+        return failures
+
+    def to_dict(self):
+        """Snapshot of the record without failed, which is kept in the log"""
+        self._unsaved = 0
+        return {
+            "broadcast_id": self.broadcast_id,
+            "message": self._message_data,
+            "source": self.source,
+            "started_at": self.started_at.isoformat(),
+            "channel_posts": {
+                str(channel_id): list(message_ids)
+                for channel_id, message_ids in self.channel_posts.items()
+            },
+            "channels_done": self.channels_done,
+            "cursor": self.cursor,
+            "delivered_count": self.delivered_count,
+            "delivered_ahead": sorted(self.delivered_ahead)
+        }
+
+    @classmethod
+    def from_dict(cls, journal, data):
+        record = cls(journal, data["broadcast_id"],
+                     ScheduledMessage.from_dict(data["message"]),
+                     data.get("source", "auto"))
+        record.started_at = datetime.fromisoformat(data["started_at"])
+        record.channel_posts = {
+            int(channel_id): message_ids
+            for channel_id, message_ids in data.get("channel_posts",
+                                                    {}).items()
+        }
+        record.channels_done = data.get("channels_done", False)
+        record.cursor = data.get("cursor")
+        record.delivered_count = data.get("delivered_count", 0)
+        record.delivered_ahead = set(data.get("delivered_ahead", []))
+        return record
+
+
+class BroadcastJournal:
+    """Persistent journal of broadcasts that have not finished yet
+
+    Progress is snapshotted to path. Failed recipients only ever grow, so
+    they are appended to failures_path as they happen instead; a save then
+    costs the same however many recipients have failed so far.
+    """
+
+    def __init__(self, path, failures_path):
+        self.path = path
+        self.failures_path = failures_path
+        self.records = {}
+
+    def load(self):
+        """Load unfinished broadcasts from the journal file
+
+        Blocks on file I/O; run it through persistence_io.
+        """
+        try:
+            data = read_snapshot(self.path)
+            if data:
+                upgrade_document(self.path, data)
+                self.records = {
+                    record_data["broadcast_id"]:
+                    BroadcastRecord.from_dict(self, record_data)
+                    for record_data in data.get("broadcasts", [])
+                }
+                self._load_failures()
+                logging.info(
+                    f"Loaded {len(self.records)} unfinished broadcasts")
+        except Exception as e:
+            logging.error(f"Failed to load broadcast journal: {e}")
+
+    def _load_failures(self):
+        if not os.path.exists(self.failures_path):
+            return
+        with open(self.failures_path, 'r') as f:
+            for line in f:
+                broadcast_id, _, chat_id = line.partition(" ")
+                record = self.records.get(broadcast_id)
+                # Lines of finished broadcasts are left until the log is
+                # cleared, and a crash can leave a torn last line
+                if (record is None or not line.endswith("\n")
+                        or not chat_id.strip().lstrip("-").isdigit()):
+                    continue
+                record.failed.add(int(chat_id))
+
+    def save(self):
+        """Queue a write of all unfinished broadcasts to the journal file"""
+        try:
+            data = {
+                "broadcasts":
+                [record.to_dict() for record in self.records.values()],
+                "schema_version": STATE_SCHEMA_VERSION
+            }
+            failures = [(record.broadcast_id, record.take_new_failures())
+                        for record in self.records.values()]
+            persistence_io.submit("broadcast journal", self._write, data,
+                                  failures)
+        except Exception as e:
+            logging.error(f"Failed to save broadcast journal: {e}")
+
+    def _write(self, data, failures):
+        # Failures are logged before the snapshot whose cursor passes them
+        lines = [
+            f"{broadcast_id} {chat_id}\n"
+            for broadcast_id, chat_ids in failures for chat_id in chat_ids
+        ]
+        if lines:
+            with open(self.failures_path, 'a') as f:
+                f.writelines(lines)
+                f.flush()
+        write_snapshot(self.path, encode_json(data))
+        if not data["broadcasts"] and os.path.exists(self.failures_path):
+            os.remove(self.failures_path)
+
+    def start(self, scheduled_msg, source):
+        """Record a new broadcast before anything is sent"""
+        record = BroadcastRecord(self, uuid.uuid4().hex, scheduled_msg, source)
+        self.records[record.broadcast_id] = record
+        self.save()
+        return record
+
+    def finish(self, record):
+        """Drop a broadcast from the journal once it has been fully sent"""
+        self.records.pop(record.broadcast_id, None)
+        self.save()
+
+
+broadcast_journal = BroadcastJournal(BROADCAST_JOURNAL_FILE,
+                                     BROADCAST_FAILURES_LOG_FILE)
+
+
+async def resume_unfinished_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """Finish broadcasts that were interrupted by a crash or restart"""
+    for record in list(broadcast_journal.records.values()):
+        scheduled_msg = record.message
+        payload = scheduled_msg.payload()
+        try:
+            # The message may still be queued if we stopped right after
+            # journaling it
+            if scheduled_msg in scheduled_messages:
+                scheduled_messages.remove(scheduled_msg)
+            else:
+                # Journaled before messages had IDs
+                for queued in list(scheduled_messages):
+                    if queued.is_duplicate_of(scheduled_msg):
+                        scheduled_messages.remove(queued)
+                        slot_scheduler.cancel(queued.id)
+            slot_scheduler.cancel(scheduled_msg.id)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
+
+            channels = [] if record.channels_done else (
+                slot_calendar.channels_for(scheduled_msg.send_time,
+                                           target_channels))
+            delivery = ChannelDelivery(
+                context.bot,
+                payload,
+                channels,
+                posted=record.channel_posts,
+                on_posted=lambda result: broadcast_journal.save())
+            source = await delivery.subscriber_source()
+
+            if not source:
+                # Nothing went out, possibly because none of the target
+                # channels posts at the slot any more, so put the message
+                # back at the front rather than drop it. Its old slot has
+                # passed, so it needs a new one to go out without a /a
+                scheduled_msg.send_time = queue_slot(0)
+                scheduled_messages.insert(0, scheduled_msg)
+                schedule_queued_message(scheduled_msg)
+                persistence.save_now(SCHEDULED_MESSAGES_FILE)
+                broadcast_journal.finish(record)
+                await context.bot.send_message(
+                    chat_id=ADMIN_IDS[0],
+                    text="⚠️ Interrupted broadcast could not reach any channel.\n"
+                    "📋 The message was returned to the front of the queue.")
+                continue
+
+            recipients = record.pending_recipients(subscribers.snapshot())
+            subscriber_count, failed_ids = await broadcast_to_subscribers(
+                lambda subscriber_id: source.send_to_user(
+                    context.bot, subscriber_id),
+                recipients,
+                progress=record)
+            await delivery.results()
+            if record.source == "auto":
+                await track_failed_subscribers(failed_ids)
+            broadcast_journal.finish(record)
+            scheduled_msg.cleanup_local_files()
+
+            await context.bot.send_message(
+                chat_id=ADMIN_IDS[0],
+                text=f"♻️ Interrupted broadcast resumed and completed!\n\n"
+                f"📤 Sent to {len(record.channel_posts)} channels\n"
+                f"👥 Sent to {subscriber_count} remaining subscribers\n"
+                f"✅ Delivered in total: {record.delivered_count}\n"
+                f"❌ Failed subscribers: {len(record.failed)}\n"
+                f"📝 Content: {scheduled_msg}")
+        except Exception as e:
+            logging.error(
+                f"Error resuming broadcast {record.broadcast_id}: {str(e)}")
+            broadcast_journal.save()
+
+
+async def send_scheduled_message_auto(context: ContextTypes.DEFAULT_TYPE,
+                                      message_id):
     """Automatically send a specific scheduled message"""
     if not auto_scheduling_active:
         return
 
     try:
-        job_data = context.job.data
-        message_index = job_data["message_index"]
-        message_id = job_data["message_id"]
-
-        # Find the message by its ID (in case the list was modified)
-        scheduled_msg = None
-        actual_index = None
-
-        for idx, msg in enumerate(scheduled_messages):
-            if id(msg) == message_id:
-                scheduled_msg = msg
-                actual_index = idx
-                break
+        # Look the message up by ID, in case the queue was edited since it
+        # was scheduled
+        scheduled_msg = scheduled_messages.get(message_id)
 
         if not scheduled_msg:
             logging.warning(f"Message with ID {message_id} not found in queue")
             return
 
-        success = False
-        sent_channels = []
+        channels = slot_calendar.channels_for(scheduled_msg.send_time,
+                                              target_channels)
+        if target_channels and not channels:
+            # The slot was given before the target channels changed and
+            # none of them posts at it now, so keep the message for the
+            # next free slot one of them does
+            held = {msg.send_time for msg in scheduled_messages}
+            send_time = slot_calendar.slot_after(scheduled_msg.send_time)
+            while send_time in held:
+                send_time = slot_calendar.slot_after(send_time)
+            scheduled_msg.send_time = send_time
+            slot_scheduler.schedule(scheduled_msg.id, send_time)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
+            logging.warning(
+                f"No target channel posts at the slot of message {message_id}; "
+                f"moved it to {send_time.strftime('%Y-%m-%d %H:%M')}")
+            return
 
-        for channel_id in target_channels:
-            try:
-                if scheduled_msg.text and not scheduled_msg.media:
-                    await context.bot.send_message(
-                        chat_id=channel_id,
-                        text=scheduled_msg.text,
-                        entities=scheduled_msg.entities)
-                    success = True
-                    sent_channels.append(channel_id)
-                elif scheduled_msg.media:
-                    media_group = []
-                    for idx, media in enumerate(scheduled_msg.media):
-                        if media['type'] == 'photo':
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-                        elif media['type'] == 'video':
-                            media_group.append(
-                                InputMediaVideo(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-                    if media_group:
-                        await context.bot.send_media_group(chat_id=channel_id,
-                                                           media=media_group)
-                        success = True
-                        sent_channels.append(channel_id)
+        payload = scheduled_msg.payload()
 
-            except Exception as e:
-                logging.error(
-                    f"Failed to send to channel {channel_id}: {str(e)}")
-                continue
+        # Journal the broadcast and take it off the queue before sending,
+        # so a restart resumes it instead of sending it twice
+        record = broadcast_journal.start(scheduled_msg, "auto")
+        if scheduled_msg in scheduled_messages:
+            scheduled_messages.remove(scheduled_msg)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
+
+        # Channels are posted to concurrently; subscribers start as soon as
+        # the post is out in a channel
+        delivery = ChannelDelivery(
+            context.bot,
+            payload,
+            channels,
+            posted=record.channel_posts,
+            on_posted=lambda result: broadcast_journal.save())
+        source = await delivery.subscriber_source()
 
         # Send to subscribers after successful channel sending
         subscriber_count = 0
         failed_subscribers = 0
 
-        if success:  # Only send to subscribers if at least one channel was successful
-            for subscriber_id in subscribers:
-                try:
-                    if scheduled_msg.text and not scheduled_msg.media:
-                        await context.bot.send_message(
-                            chat_id=subscriber_id,
-                            text=scheduled_msg.text,
-                            entities=scheduled_msg.entities,
-                            reply_markup=get_navigation_buttons(),
-                            protect_content=True)
-                    elif scheduled_msg.media:
-                        if len(scheduled_msg.media) == 1:
-                            media = scheduled_msg.media[0]
-                            if media['type'] == 'photo':
-                                await context.bot.send_photo(
-                                    chat_id=subscriber_id,
-                                    photo=media['file_id'],
-                                    caption=media['caption'],
-                                    caption_entities=media['caption_entities'],
-                                    reply_markup=get_navigation_buttons())
-                            elif media['type'] == 'video':
-                                await context.bot.send_video(
-                                    chat_id=subscriber_id,
-                                    video=media['file_id'],
-                                    caption=media['caption'],
-                                    caption_entities=media['caption_entities'],
-                                    reply_markup=get_navigation_buttons())
-                        else:
-                            # Media group
-                            media_group = []
-                            for idx, media in enumerate(scheduled_msg.media):
-                                if media['type'] == 'photo':
-                                    media_group.append(
-                                        InputMediaPhoto(
-                                            media=media['file_id'],
-                                            caption=media['caption']
-                                            if idx == 0 else None,
-                                            caption_entities=media[
-                                                'caption_entities']
-                                            if idx == 0 else None))
-                                elif media['type'] == 'video':
-                                    media_group.append(
-                                        InputMediaVideo(
-                                            media=media['file_id'],
-                                            caption=media['caption']
-                                            if idx == 0 else None,
-                                            caption_entities=media[
-                                                'caption_entities']
-                                            if idx == 0 else None))
-                            if media_group:
-                                await context.bot.send_media_group(
-                                    chat_id=subscriber_id, media=media_group)
-                                # Send navigation buttons after media group
-                                await context.bot.send_message(
-                                    chat_id=subscriber_id,
-                                    text="",
-                                    reply_markup=get_navigation_buttons())
-                    subscriber_count += 1
-                except Exception as e:
-                    failed_subscribers += 1
-                    await track_failed_subscriber(subscriber_id)
-                    logging.error(
-                        f"Failed to send to subscriber {subscriber_id}: {e}")
-
-        # Remove the sent message from the queue regardless of channel/subscriber success
-        if scheduled_msg in scheduled_messages:
-            scheduled_messages.remove(scheduled_msg)
-            save_scheduled_messages()
+        if source:  # Only send to subscribers if at least one channel was successful
+            subscriber_count, failed_ids = await broadcast_to_subscribers(
+                lambda subscriber_id: source.send_to_user(
+                    context.bot, subscriber_id),
+                subscribers.snapshot(),
+                progress=record)
+            failed_subscribers = len(failed_ids)
+            await track_failed_subscribers(failed_ids)
+
+        channel_results = await delivery.results()
+        sent_channels = [result for result in channel_results if result.ok]
+        success = bool(sent_channels)
+        record.channels_done = True
+
+        broadcast_journal.finish(record)
 
         if success or subscriber_count > 0:
 
@@ -1674,6 +3812,8 @@ async def send_scheduled_message_auto(context: ContextTypes.DEFAULT_TYPE):
                 f"📤 Sent to {len(sent_channels)} channels\n"
                 f"👥 Sent to {subscriber_count} subscribers\n"
                 f"❌ Failed subscribers: {failed_subscribers}\n"
+                f"⚙️ Send rate: {broadcast_controller.rate:.1f} msg/s, "
+                f"{broadcast_controller.workers} concurrent senders\n"
                 f"📝 Content: {preview}\n"
                 f"🕒 Time: {datetime.now(cairo_tz).strftime('%I:%M %p, %d/%m/%Y')}\n"
                 f"📋 Remaining in queue: {len(scheduled_messages)}")
@@ -1697,85 +3837,36 @@ async def send_scheduled_message_auto(context: ContextTypes.DEFAULT_TYPE):
             text=f"⚠️ Error sending scheduled message: {str(e)}")
 
 
-async def trigger_send_command(context: ContextTypes.DEFAULT_TYPE):
-    """Legacy function for backward compatibility"""
-    if not auto_scheduling_active or not scheduled_messages:
-        return
-
-    # This function is kept for backward compatibility
-    # The new system uses send_scheduled_message_auto for individual message scheduling
-
-
 async def send_scheduled_message(context: ContextTypes.DEFAULT_TYPE):
     try:
         # Extract the scheduled message and target channels from the job context
         job_data = context.job.data
         scheduled_msg = job_data[0]
         target_channels = job_data[1]
+        payload = scheduled_msg.payload()
         success = False
 
-        # Attempt to send the message to all target channels
-        for channel_id in target_channels:
-            try:
-                # Check if the bot has admin rights in the channel
-                chat = await context.bot.get_chat(channel_id)
-                chat_member = await context.bot.get_chat_member(
-                    chat_id=channel_id, user_id=context.bot.id)
-
-                if chat_member.status not in ['administrator', 'creator']:
-                    logging.warning(
-                        f"Bot is not admin in channel {chat.title} ({channel_id}). Skipping..."
-                    )
-                    continue
-
-                # Send text message
-                if scheduled_msg.text and not scheduled_msg.media:
-                    await context.bot.send_message(
-                        chat_id=channel_id,
-                        text=scheduled_msg.text,
-                        entities=scheduled_msg.entities)
-                    success = True
-
-                # Send media group
-                elif scheduled_msg.media:
-                    media_group = []
-                    for idx, media in enumerate(scheduled_msg.media):
-                        if media['type'] == 'photo':
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-                        elif media['type'] == 'video':
-                            media_group.append(
-                                InputMediaVideo(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-
-                    if media_group:
-                        await context.bot.send_media_group(chat_id=channel_id,
-                                                           media=media_group)
-                        success = True
-
-            except Exception as e:
-                logging.error(
-                    f"Failed to send message to channel {channel_id}: {str(e)}"
-                )
+        # Attempt to send the message to all target channels at once
+        delivery = ChannelDelivery(context.bot,
+                                   payload,
+                                   target_channels,
+                                   check_admin=True)
+        for result in await delivery.results():
+            if result.ok:
+                success = True
+            elif not result.not_admin:
                 await context.bot.send_message(
                     chat_id=ADMIN_IDS[0],
                     text=
-                    f"⚠️ Failed to send message to channel {channel_id}: {str(e)}"
+                    f"⚠️ Failed to send message to channel {result.channel_id}: {result.error}"
                 )
 
         # If message was sent successfully to at least one channel
         if success:
             if scheduled_msg in scheduled_messages:
                 scheduled_messages.remove(scheduled_msg)
+                slot_scheduler.cancel(scheduled_msg.id)
+                persistence.save_now(SCHEDULED_MESSAGES_FILE)
                 await context.bot.send_message(
                     chat_id=ADMIN_IDS[0],
                     text="✅ Scheduled message sent and removed from queue!")
@@ -1813,7 +3904,8 @@ async def remove_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         removed_msg = scheduled_messages.pop(msg_id - 1)
-        save_scheduled_messages()
+        slot_scheduler.cancel(removed_msg.id)
+        persistence.save_now(SCHEDULED_MESSAGES_FILE)
         # Clean up local files
         removed_msg.cleanup_local_files()
         await update.message.reply_text(f"✅ Removed message: {removed_msg}")
@@ -1823,28 +3915,7 @@ async def remove_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def is_time_slot_taken(scheduled_time):
     """Check if any message is already scheduled for the given time"""
-    scheduled_hour = scheduled_time.hour
-
-    for msg in scheduled_messages:
-        idx = scheduled_messages.index(msg)
-        current_time = datetime.now(cairo_tz)
-        next_odd_hour = current_time.hour + (1 if current_time.hour %
-                                             2 == 0 else 2)
-
-        if next_odd_hour >= 24:
-            next_odd_hour = 1
-            next_send_time = current_time.replace(
-                hour=next_odd_hour, minute=0, second=0) + timedelta(days=1)
-        else:
-            next_send_time = current_time.replace(hour=next_odd_hour,
-                                                  minute=0,
-                                                  second=0)
-
-        msg_time = next_send_time + timedelta(hours=2 * idx)
-
-        if msg_time.hour == scheduled_hour:
-            return True
-    return False
+    return slot_timeline.hour_taken(scheduled_time.hour)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1970,32 +4041,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Add to scheduled messages queue instead of immediate scheduling
             position = len(scheduled_messages) + 1
             scheduled_messages.append(scheduled_msg)
-            save_scheduled_messages()
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
             # Calculate when this message will be sent based on its position in queue
-            egypt_tz = pytz.timezone('Africa/Cairo')
-            current_time = datetime.now(egypt_tz)
-            current_hour = current_time.hour
-
-            if current_hour % 2 == 0:
-                next_odd_hour = current_hour + 1
-            else:
-                next_odd_hour = current_hour + 2
-
-            if next_odd_hour >= 24:
-                next_odd_hour = 1
-                next_send_time = current_time.replace(
-                    hour=next_odd_hour, minute=0, second=0,
-                    microsecond=0) + timedelta(days=1)
-            else:
-                next_send_time = current_time.replace(hour=next_odd_hour,
-                                                      minute=0,
-                                                      second=0,
-                                                      microsecond=0)
-
-            # Calculate send time based on position in queue
-            send_time = next_send_time + timedelta(hours=2 * (position - 1))
+            send_time = queue_slot(position - 1)
             scheduled_msg.send_time = send_time
+            schedule_queued_message(scheduled_msg)
 
             await update.message.reply_text(
                 f"✅ Message added to scheduled queue!\n\n"
@@ -2058,28 +4109,14 @@ async def finalize_media_group(media_group_id,
                 return
 
             # Calculate the send time based on the position in the queue
-            current_time = datetime.now(cairo_tz)
-            next_odd_hour = current_time.hour + (1 if current_time.hour %
-                                                 2 == 0 else 2)
-
-            if next_odd_hour >= 24:
-                next_odd_hour = 1
-                next_send_time = current_time.replace(
-                    hour=next_odd_hour, minute=0, second=0,
-                    microsecond=0) + timedelta(days=1)
-            else:
-                next_send_time = current_time.replace(hour=next_odd_hour,
-                                                      minute=0,
-                                                      second=0,
-                                                      microsecond=0)
-
-            # Adjust send time based on the position in the queue
             position = len(scheduled_messages) + 1
-            send_time = next_send_time + timedelta(hours=2 * (position - 1))
+            send_time = queue_slot(position - 1)
 
             # Add to scheduled messages and send confirmation
             scheduled_msg.send_time = send_time
             scheduled_messages.append(scheduled_msg)
+            schedule_queued_message(scheduled_msg)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
@@ -2106,63 +4143,21 @@ async def send_message_to_channels(context: ContextTypes.DEFAULT_TYPE,
                                    target_channels):
     try:
         success = False
-
-        # Attempt to send the message to all target channels
-        for channel_id in target_channels:
-            try:
-                # Check if the bot has admin rights in the channel
-                chat = await context.bot.get_chat(channel_id)
-                chat_member = await context.bot.get_chat_member(
-                    chat_id=channel_id, user_id=context.bot.id)
-
-                if chat_member.status not in ['administrator', 'creator']:
-                    logging.warning(
-                        f"Bot is not admin in channel {chat.title} ({channel_id}). Skipping..."
-                    )
-                    continue
-
-                # Send text message
-                if scheduled_msg.text and not scheduled_msg.media:
-                    await context.bot.send_message(
-                        chat_id=channel_id,
-                        text=scheduled_msg.text,
-                        entities=scheduled_msg.entities)
-                    success = True
-
-                # Send media group
-                elif scheduled_msg.media:
-                    media_group = []
-                    for idx, media in enumerate(scheduled_msg.media):
-                        if media['type'] == 'photo':
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-                        elif media['type'] == 'video':
-                            media_group.append(
-                                InputMediaVideo(
-                                    media=media['file_id'],
-                                    caption=media['caption']
-                                    if idx == 0 else None,
-                                    caption_entities=media['caption_entities']
-                                    if idx == 0 else None))
-
-                    if media_group:
-                        await context.bot.send_media_group(chat_id=channel_id,
-                                                           media=media_group)
-                        success = True
-
-            except Exception as e:
-                logging.error(
-                    f"Failed to send message to channel {channel_id}: {str(e)}"
-                )
+        payload = scheduled_msg.payload()
+
+        # Attempt to send the message to all target channels at once
+        delivery = ChannelDelivery(context.bot,
+                                   payload,
+                                   target_channels,
+                                   check_admin=True)
+        for result in await delivery.results():
+            if result.ok:
+                success = True
+            elif not result.not_admin:
                 await context.bot.send_message(
                     chat_id=ADMIN_IDS[0],
                     text=
-                    f"⚠️ Failed to send message to channel {channel_id}: {str(e)}"
+                    f"⚠️ Failed to send message to channel {result.channel_id}: {result.error}"
                 )
 
         # If message was sent successfully to at least one channel
@@ -2223,140 +4218,62 @@ async def send_first_message(update: Update,
                                             )
         return
 
-    success = False
     subscriber_count = 0
     failed_subscribers = 0
+    payload = scheduled_msg.payload()
+    record = broadcast_journal.start(scheduled_msg, "send")
+
+    # Post to every channel at once; subscribers start as soon as the post
+    # is out in a channel
+    delivery = ChannelDelivery(
+        context.bot,
+        payload,
+        target_channels,
+        check_admin=True,
+        posted=record.channel_posts,
+        on_posted=lambda result: broadcast_journal.save())
+    source = await delivery.subscriber_source()
 
-    for channel_id in target_channels:
-        try:
-            # Force refresh chat member status
-            chat = await context.bot.get_chat(channel_id)
-            chat_member = await context.bot.get_chat_member(
-                chat_id=channel_id, user_id=context.bot.id)
+    # Send to subscribers after successful channel sending
+    if source:  # Only send to subscribers if at least one channel was successful
+        # Take the message off the queue first, so a restart resumes this
+        # broadcast from the journal instead of sending it again
+        if scheduled_msg in scheduled_messages:
+            scheduled_messages.remove(scheduled_msg)
+            slot_scheduler.cancel(scheduled_msg.id)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
+        broadcast_journal.save()
+
+        subscriber_count, failed_ids = await broadcast_to_subscribers(
+            lambda subscriber_id: source.send_to_user(
+                context.bot, subscriber_id),
+            subscribers.snapshot(),
+            progress=record)
+        failed_subscribers = len(failed_ids)
+
+    channel_results = await delivery.results()
+    sent_channels = [result for result in channel_results if result.ok]
+    success = bool(sent_channels)
+    record.channels_done = True
 
-            if chat_member.status in ['administrator', 'creator']:
-                try:
-                    # Send text if present and no media
-                    if scheduled_msg.text and not scheduled_msg.media:
-                        await context.bot.send_message(
-                            chat_id=channel_id,
-                            text=scheduled_msg.text,
-                            entities=scheduled_msg.entities)
-                        success = True
-
-                    # Send media group if there are media files
-                    if scheduled_msg.media:
-                        media_group = []
-                        for idx, media in enumerate(scheduled_msg.media):
-                            if media['type'] == 'photo':
-                                media_group.append(
-                                    InputMediaPhoto(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                            elif media['type'] == 'video':
-                                media_group.append(
-                                    InputMediaVideo(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                        await context.bot.send_media_group(chat_id=channel_id,
-                                                           media=media_group)
-                        success = True
-                except Exception as e:
-                    logging.error(
-                        f"Failed tosend message to channel {chat.title}: {str(e)}"
-                    )
-                    if update:
-                        await update.message.reply_text(
-                            f"⚠️ Failed to send message to channel {chat.title}: {str(e)}"
-                        )
-            else:
-                if update:
-                    await update.message.reply_text(
-                        f"⚠️ Bot is not admin in channel {chat.title} ({channel_id})"
-                    )
-        except Exception as e:
-            if update:
+    if update:
+        for result in channel_results:
+            if result.not_admin:
                 await update.message.reply_text(
-                    f"⚠️ Failed to send to channel {channel_id}: {str(e)}")
+                    f"⚠️ Bot is not admin in channel {result.name}")
+            elif not result.ok:
+                await update.message.reply_text(
+                    f"⚠️ Failed to send message to channel {result.name}: {result.error}"
+                )
 
-    # Send to subscribers after successful channel sending
-    if success:  # Only send to subscribers if at least one channel was successful
-        for subscriber_id in subscribers:
-            try:
-                if scheduled_msg.text and not scheduled_msg.media:
-                    await context.bot.send_message(
-                        chat_id=subscriber_id,
-                        text=scheduled_msg.text,
-                        entities=scheduled_msg.entities,
-                        reply_markup=get_navigation_buttons())
-                elif scheduled_msg.media:
-                    if len(scheduled_msg.media) == 1:
-                        media = scheduled_msg.media[0]
-                        if media['type'] == 'photo':
-                            await context.bot.send_photo(
-                                chat_id=subscriber_id,
-                                photo=media['file_id'],
-                                caption=media['caption'],
-                                caption_entities=media['caption_entities'],
-                                reply_markup=get_navigation_buttons(),
-                                protect_content=True)
-                        elif media['type'] == 'video':
-                            await context.bot.send_video(
-                                chat_id=subscriber_id,
-                                video=media['file_id'],
-                                caption=media['caption'],
-                                caption_entities=media['caption_entities'],
-                                reply_markup=get_navigation_buttons(),
-                                protect_content=True)
-                    else:
-                        # Media group
-                        media_group = []
-                        for idx, media in enumerate(scheduled_msg.media):
-                            if media['type'] == 'photo':
-                                media_group.append(
-                                    InputMediaPhoto(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                            elif media['type'] == 'video':
-                                media_group.append(
-                                    InputMediaVideo(media=media['file_id'],
-                                                    caption=media['caption']
-                                                    if idx == 0 else None,
-                                                    caption_entities=media[
-                                                        'caption_entities']
-                                                    if idx == 0 else None))
-                        if media_group:
-                            await context.bot.send_media_group(
-                                chat_id=subscriber_id, media=media_group)
-                            # Send navigation buttons after media group
-                            await context.bot.send_message(
-                                chat_id=subscriber_id,
-                                text="",
-                                reply_markup=get_navigation_buttons())
-                subscriber_count += 1
-            except Exception as e:
-                failed_subscribers += 1
-                logging.error(
-                    f"Failed to send to subscriber {subscriber_id}: {e}")
+    broadcast_journal.finish(record)
 
     if success or subscriber_count > 0:
-        # Remove the sent message from the scheduled list
-        sent_msg = scheduled_messages.pop(msg_id - 1)
-        save_scheduled_messages()
-        sent_msg.cleanup_local_files()
+        scheduled_msg.cleanup_local_files()
         if update:
             await update.message.reply_text(
                 f"✅ Message sent successfully!\n"
-                f"📤 Sent to {len([ch for ch in target_channels if success])} channels\n"
+                f"📤 Sent to {len(sent_channels)} channels\n"
                 f"👥 Sent to {subscriber_count} subscribers\n"
                 f"❌ Failed subscribers: {failed_subscribers}\n"
                 f"Message removed from schedule.")
@@ -2398,43 +4315,10 @@ async def show_message_preview(update: Update,
 
         msg = scheduled_messages[msg_id - 1]
 
-        if msg.text and not msg.media:
-            await context.bot.send_message(chat_id=update.effective_chat.id,
-                                           text=msg.text,
-                                           entities=msg.entities)
-        elif msg.media:
-            media_group = []
-            for idx, media in enumerate(msg.media):
-                if media['type'] == 'photo':
-                    media_group.append(
-                        InputMediaPhoto(
-                            media=media['file_id'],
-                            caption=media['caption'] if idx == 0 else None,
-                            caption_entities=media['caption_entities']
-                            if idx == 0 else None))
-                elif media['type'] == 'video':
-                    media_group.append(
-                        InputMediaVideo(
-                            media=media['file_id'],
-                            caption=media['caption'] if idx == 0 else None,
-                            caption_entities=media['caption_entities']
-                            if idx == 0 else None))
-
-            if len(media_group) > 1:
-                await context.bot.send_media_group(
-                    chat_id=update.effective_chat.id, media=media_group)
-            else:
-                await context.bot.send_photo(
-                    chat_id=update.effective_chat.id,
-                    photo=msg.media[0]['file_id'],
-                    caption=msg.media[0]['caption'],
-                    caption_entities=msg.media[0]['caption_entities']
-                ) if msg.media[0][
-                    'type'] == 'photo' else await context.bot.send_video(
-                        chat_id=update.effective_chat.id,
-                        video=msg.media[0]['file_id'],
-                        caption=msg.media[0]['caption'],
-                        caption_entities=msg.media[0]['caption_entities'])
+        await msg.payload().send_to_user(context.bot,
+                                         update.effective_chat.id,
+                                         navigation=False,
+                                         protect_content=False)
     except ValueError:
         await update.message.reply_text("⚠️ Please provide a valid number")
 
@@ -2457,7 +4341,7 @@ async def handle_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
         channels_list = "📋 Target Channels:\n\n"
         for channel in target_channels:
             try:
-                chat = await context.bot.get_chat(channel)
+                chat = await chat_cache.get_chat(context.bot, channel)
                 channels_list += f"ID: {channel} - Title: {chat.title}\n"
             except:
                 channels_list += f"ID: {channel} - Unable to fetch details\n"
@@ -2478,16 +4362,18 @@ async def handle_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if action == "add":
         try:
-            # Verify the chat exists and bot has access
-            chat = await context.bot.get_chat(chat_id)
+            # Verify the chat exists and bot has access, skipping any
+            # stale cached answer
+            chat_cache.invalidate(chat_id)
+            chat = await chat_cache.get_chat(context.bot, chat_id)
             # Verify bot's admin status
-            chat_member = await context.bot.get_chat_member(
-                chat_id=chat_id, user_id=context.bot.id)
-            if chat_member.status not in ['administrator', 'creator']:
+            if not await chat_cache.is_bot_admin(context.bot, chat_id):
                 await update.message.reply_text(
                     "⚠️ Bot must be an admin in the target channel")
                 return
             target_channels.add(chat_id)
+            slot_calendar.channels_changed()
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
             await update.message.reply_text(
                 f"✅ Added channel {chat.title} to targets")
         except Exception as e:
@@ -2496,6 +4382,9 @@ async def handle_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == "remove":
         if chat_id in target_channels:
             target_channels.remove(chat_id)
+            slot_calendar.channels_changed()
+            chat_cache.invalidate(chat_id)
+            persistence.save_now(SCHEDULED_MESSAGES_FILE)
             await update.message.reply_text("✅ Channel removed from targets")
         else:
             await update.message.reply_text("⚠️ Channel not found in targets")
@@ -2565,21 +4454,7 @@ async def schedule_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
             position = len(scheduled_messages) + 1
 
             # Calculate next send time in Cairo timezone
-            cairo_tz = pytz.timezone('Africa/Cairo')
-            current_time = datetime.now(cairo_tz)
-            next_odd_hour = current_time.hour + (1 if current_time.hour %
-                                                 2 == 0 else 2)
-
-            if next_odd_hour >= 24:
-                next_odd_hour = 1
-                next_send_time = current_time.replace(
-                    hour=next_odd_hour, minute=0, second=0,
-                    microsecond=0) + timedelta(days=1)
-            else:
-                next_send_time = current_time.replace(hour=next_odd_hour,
-                                                      minute=0,
-                                                      second=0,
-                                                      microsecond=0)
+            next_send_time = next_send_slot()
 
             # Check for duplicates before processing
             if is_duplicate_scheduled_message(scheduled_msg, next_send_time):
@@ -2620,29 +4495,10 @@ async def schedule_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
         scheduled_messages.append(scheduled_msg)
 
         # Calculate when this message will be sent based on its position in queue
-        egypt_tz = pytz.timezone('Africa/Cairo')
-        current_time = datetime.now(egypt_tz)
-        current_hour = current_time.hour
-
-        if current_hour % 2 == 0:
-            next_odd_hour = current_hour + 1
-        else:
-            next_odd_hour = current_hour + 2
-
-        if next_odd_hour >= 24:
-            next_odd_hour = 1
-            next_send_time = current_time.replace(
-                hour=next_odd_hour, minute=0, second=0,
-                microsecond=0) + timedelta(days=1)
-        else:
-            next_send_time = current_time.replace(hour=next_odd_hour,
-                                                  minute=0,
-                                                  second=0,
-                                                  microsecond=0)
-
-        # Calculate send time based on position in queue
-        send_time = next_send_time + timedelta(hours=2 * (position - 1))
+        send_time = queue_slot(position - 1)
         scheduled_msg.send_time = send_time
+        schedule_queued_message(scheduled_msg)
+        persistence.save_now(SCHEDULED_MESSAGES_FILE)
 
         await update.message.reply_text(
             f"✅ Message added to scheduled queue!\n\n"
@@ -2654,54 +4510,64 @@ async def schedule_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def is_duplicate_scheduled_message(new_msg, scheduled_time):
     """Check if a message is already scheduled for the same time"""
-    # Get the hour of the new message's schedule
-    scheduled_hour = scheduled_time.hour
-
-    for msg in scheduled_messages:
-        # Calculate this message's scheduled time
-        idx = scheduled_messages.index(msg)
-        current_time = datetime.now(cairo_tz)
-        next_odd_hour = current_time.hour + (1 if current_time.hour %
-                                             2 == 0 else 2)
-
-        if next_odd_hour >= 24:
-            next_odd_hour = 1
-            next_send_time = current_time.replace(
-                hour=next_odd_hour, minute=0, second=0) + timedelta(days=1)
-        else:
-            next_send_time = current_time.replace(hour=next_odd_hour,
-                                                  minute=0,
-                                                  second=0)
-
-        msg_time = next_send_time + timedelta(hours=2 * idx)
-
-        # If the times match and content is duplicate
-        if msg_time.hour == scheduled_hour and new_msg.is_duplicate_of(msg):
-            return True
-
-    return False
+    return slot_timeline.has_duplicate(new_msg, scheduled_time.hour)
+
+
+class CollectedPostsCache:
+    """In-memory copy of the collected posts
+
+    The "Latest" menu reads the collected posts on every tap, but they only
+    change through /collect and auto-collection, which hand their result to
+    saved(). Taps are served from memory; the storage version is checked
+    at most every check_interval seconds so edits made to the file (or the
+    database) outside the bot are still picked up.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._posts = None
+        self._version = None
+        self._checked_at = 0
+
+    async def get(self):
+        """Return the collected posts; the list must not be modified"""
+        now = time.monotonic()
+        if (self._posts is None
+                or now - self._checked_at >= self.check_interval):
+            self._checked_at = now
+            # Read the version first, so a change during the load is seen
+            # at the next check rather than missed
+            version = await persistence_io.run(storage.version,
+                                               COLLECTED_POSTS_FILE)
+            if self._posts is None or version != self._version:
+                data = await persistence_io.run(storage.load,
+                                                COLLECTED_POSTS_FILE)
+                self._posts = data.get("collected_posts", []) if data else []
+                self._version = version
+        return self._posts
+
+    async def saved(self, posts):
+        """Take posts as the current collection once they are stored"""
+        self._posts = posts
+        self._version = await persistence_io.run(storage.version,
+                                                 COLLECTED_POSTS_FILE)
+        self._checked_at = time.monotonic()
+
+
+collected_posts_cache = CollectedPostsCache(STORAGE_CHECK_INTERVAL)
 
 
 async def load_collected_posts():
-    """Load collected posts from JSON file"""
+    """Load collected posts, from memory unless storage has changed"""
     try:
-        if not os.path.exists(COLLECTED_POSTS_FILE):
-            return []
-
-        async with aiofiles.open(COLLECTED_POSTS_FILE, 'r') as f:
-            content = await f.read()
-            if not content.strip():
-                return []
-
-        data = json.loads(content)
-        return data.get("collected_posts", [])
+        return await collected_posts_cache.get()
     except Exception as e:
         logging.error(f"Error loading collected posts: {e}")
         return []
 
 
 async def save_collected_posts(collected_posts):
-    """Save collected posts to JSON file"""
+    """Save collected posts to storage"""
     try:
         data = {
             "collected_posts": collected_posts,
@@ -2709,8 +4575,8 @@ async def save_collected_posts(collected_posts):
             "total_posts": len(collected_posts)
         }
 
-        async with aiofiles.open(COLLECTED_POSTS_FILE, 'w') as f:
-            await f.write(json.dumps(data, indent=2))
+        await persistence_io.run(storage.save, COLLECTED_POSTS_FILE, data)
+        await collected_posts_cache.saved(collected_posts)
 
         logging.info(f"Saved {len(collected_posts)} collected posts")
     except Exception as e:
@@ -2781,7 +4647,11 @@ async def auto_collect_new_post(context: ContextTypes.DEFAULT_TYPE, channel_id,
                 'date':
                 copied.date.isoformat() if copied.date else None,
                 'collected_at':
-                datetime.now().isoformat()
+                datetime.now().isoformat(),
+                'is_media_group':
+                False,
+                'media_group_size':
+                1
             }
 
             # Delete the copied message immediately
@@ -2808,11 +4678,10 @@ async def auto_collect_new_post(context: ContextTypes.DEFAULT_TYPE, channel_id,
         # Check if this message is already collected
         existing_ids = [post['message_id'] for post in collected_posts]
         if message_id not in existing_ids:
-            # Add new post
-            collected_posts.append(new_post)
-
-            # Remove duplicates, keeping newest
-            collected_posts = remove_duplicates_keep_newest(collected_posts)
+            # Add new post and remove duplicates, keeping newest; the loaded
+            # list is the shared cache, so build a new one
+            collected_posts = remove_duplicates_keep_newest(collected_posts +
+                                                            [new_post])
 
             # Sort by message_id descending (newest first)
             collected_posts.sort(key=lambda x: x['message_id'], reverse=True)
@@ -2969,7 +4838,11 @@ async def collect_posts(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         'date':
                         copied.date.isoformat() if copied.date else None,
                         'collected_at':
-                        datetime.now().isoformat()
+                        datetime.now().isoformat(),
+                        'is_media_group':
+                        False,
+                        'media_group_size':
+                        1
                     }
 
                     # Delete the copied message immediately to clean up
@@ -3129,8 +5002,8 @@ async def update_top_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Please use: /utop <number>")
         return
 
-    # Reload top posts to ensure consistency
-    load_top_posts()
+    # Pick up changes made to storage outside the bot
+    await refresh_top_posts()
 
     try:
         post_index = int(context.args[0]) - 1  # Convert to 0-based index
@@ -3155,7 +5028,7 @@ async def update_top_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             # Replace the top post
             top_posts[post_index] = new_top_msg
-            save_top_posts()
+            top_posts_changed()
             await update.message.reply_text(
                 f"✅ Replaced TOP post #{post_index + 1}! Total top posts: {len(top_posts)}"
             )
@@ -3181,14 +5054,14 @@ async def remove_top_post_by_id(update: Update,
         await update.message.reply_text("⚠️ Please use: /top_r <number>")
         return
 
-    # Reload top posts to ensure consistency
-    load_top_posts()
+    # Pick up changes made to storage outside the bot
+    await refresh_top_posts()
 
     try:
         post_index = int(context.args[0]) - 1  # Convert to 0-based index
         if 0 <= post_index < len(top_posts):
             removed_post = top_posts.pop(post_index)
-            save_top_posts()
+            top_posts_changed()
             await update.message.reply_text(
                 f"✅ Removed TOP post #{post_index + 1}! Total remaining: {len(top_posts)}"
             )
@@ -3207,26 +5080,43 @@ async def load_failed_subscribers():
     """Load failed subscribers data"""
     global failed_subscribers
     try:
-        if os.path.exists(FAILED_SUBSCRIBERS_FILE):
-            async with aiofiles.open(FAILED_SUBSCRIBERS_FILE, 'r') as f:
-                content = await f.read()
-                if content.strip():
-                    data = json.loads(content)
-                    failed_subscribers = data.get("failed_subscribers", {})
+        data = await persistence_io.run(storage.load, FAILED_SUBSCRIBERS_FILE)
+        if data:
+            failed_subscribers = data.get("failed_subscribers", {})
     except Exception as e:
         logging.error(f"Failed to load failed subscribers: {e}")
 
 
-def save_failed_subscribers():
-    """Save failed subscribers data"""
+def save_failed_subscribers(changed=None, removed=None):
+    """Save failed subscribers data
+
+    Pass the IDs whose count changed or that were removed to write just
+    those rows. Backends without row-level writes get the whole dataset
+    marked for the next write-behind flush instead.
+    """
     try:
-        data = {"failed_subscribers": failed_subscribers}
-        with open(FAILED_SUBSCRIBERS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        if (changed is not None
+                or removed is not None) and not storage.row_writes:
+            persistence.mark_dirty(FAILED_SUBSCRIBERS_FILE)
+        elif changed is not None:
+            persistence_io.submit(
+                "failed subscribers", storage.set_failures,
+                {str_id: failed_subscribers[str_id]
+                 for str_id in changed})
+        elif removed is not None:
+            persistence_io.submit("failed subscribers",
+                                  storage.remove_failures, list(removed))
+        else:
+            persistence_io.submit(
+                "failed subscribers", storage.save, FAILED_SUBSCRIBERS_FILE,
+                {"failed_subscribers": dict(failed_subscribers)})
     except Exception as e:
         logging.error(f"Failed to save failed subscribers: {e}")
 
 
+persistence.register(FAILED_SUBSCRIBERS_FILE, save_failed_subscribers)
+
+
 async def track_failed_subscriber(subscriber_id):
     """Track a failed subscriber send"""
     global failed_subscribers
@@ -3235,7 +5125,19 @@ async def track_failed_subscriber(subscriber_id):
         failed_subscribers[str_id] += 1
     else:
         failed_subscribers[str_id] = 1
-    save_failed_subscribers()
+    save_failed_subscribers(changed=[str_id])
+
+
+async def track_failed_subscribers(subscriber_ids):
+    """Track a batch of failed subscriber sends with a single save"""
+    if not subscriber_ids:
+        return
+    changed = []
+    for subscriber_id in subscriber_ids:
+        str_id = str(subscriber_id)
+        failed_subscribers[str_id] = failed_subscribers.get(str_id, 0) + 1
+        changed.append(str_id)
+    save_failed_subscribers(changed=changed)
 
 
 async def d_failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3304,12 +5206,9 @@ async def su_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def load_daily_analytics():
     """Load daily analytics data"""
     try:
-        if os.path.exists(DAILY_ANALYTICS_FILE):
-            async with aiofiles.open(DAILY_ANALYTICS_FILE, 'r') as f:
-                content = await f.read()
-                if content.strip():
-                    data = json.loads(content)
-                    return data.get("analytics", {})
+        data = await persistence_io.run(storage.load, DAILY_ANALYTICS_FILE)
+        if data:
+            return data.get("analytics", {})
         return {}
     except Exception as e:
         logging.error(f"Failed to load daily analytics: {e}")
@@ -3320,8 +5219,8 @@ def save_daily_analytics(analytics_data):
     """Save daily analytics data"""
     try:
         data = {"analytics": analytics_data}
-        with open(DAILY_ANALYTICS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        persistence_io.submit("daily analytics", storage.save,
+                              DAILY_ANALYTICS_FILE, data)
     except Exception as e:
         logging.error(f"Failed to save daily analytics: {e}")
 
@@ -3346,23 +5245,19 @@ async def tops_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "total_posts": len(top_posts)
         }
 
-        # Save to temporary file
+        # Serialize off the event loop
         filename = f"top_posts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w') as f:
-            json.dump(export_data, f, indent=2)
+        file_content = await persistence_io.run(
+            lambda: json.dumps(export_data, indent=2).encode())
 
         # Send file
-        with open(filename, 'rb') as f:
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=f,
-                filename=filename,
-                caption=f"📤 Top Posts Export\n\n"
-                f"📊 Total posts: {len(top_posts)}\n"
-                f"📅 Exported: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Clean up
-        os.remove(filename)
+        await context.bot.send_document(
+            chat_id=user_id,
+            document=file_content,
+            filename=filename,
+            caption=f"📤 Top Posts Export\n\n"
+            f"📊 Total posts: {len(top_posts)}\n"
+            f"📅 Exported: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     except Exception as e:
         logging.error(f"Error exporting top posts: {e}")
@@ -3387,12 +5282,10 @@ async def receive_tops_command(update: Update,
         # Download file
         file = await context.bot.get_file(
             update.message.reply_to_message.document.file_id)
-        file_path = f"temp_tops_import_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        await file.download_to_drive(file_path)
+        content = await file.download_as_bytearray()
 
-        # Load and validate data
-        with open(file_path, 'r') as f:
-            import_data = json.load(f)
+        # Parse and validate data
+        import_data = await persistence_io.run(decode_json, content)
 
         if "top_posts" not in import_data:
             await update.message.reply_text(
@@ -3405,10 +5298,7 @@ async def receive_tops_command(update: Update,
             ScheduledMessage.from_dict(post_data)
             for post_data in import_data["top_posts"]
         ]
-        save_top_posts()
-
-        # Clean up
-        os.remove(file_path)
+        top_posts_changed()
 
         await update.message.reply_text(
             f"✅ Successfully imported {len(top_posts)} top posts!")
@@ -3474,12 +5364,10 @@ async def delete_latest_command(update: Update,
 async def load_sent_posts_tracking():
     """Load sent posts tracking data"""
     try:
-        if os.path.exists(SENT_POSTS_TRACKING_FILE):
-            async with aiofiles.open(SENT_POSTS_TRACKING_FILE, 'r') as f:
-                content = await f.read()
-                if content.strip():
-                    data = json.loads(content)
-                    return data.get("sent_posts", [])
+        data = await persistence_io.run(storage.load,
+                                        SENT_POSTS_TRACKING_FILE)
+        if data:
+            return data.get("sent_posts", [])
         return []
     except Exception as e:
         logging.error(f"Failed to load sent posts tracking: {e}")
@@ -3490,12 +5378,22 @@ async def save_sent_posts_tracking(sent_posts):
     """Save sent posts tracking data"""
     try:
         data = {"sent_posts": sent_posts}
-        async with aiofiles.open(SENT_POSTS_TRACKING_FILE, 'w') as f:
-            await f.write(json.dumps(data, indent=2))
+        await persistence_io.run(storage.save, SENT_POSTS_TRACKING_FILE,
+                                 data)
     except Exception as e:
         logging.error(f"Failed to save sent posts tracking: {e}")
 
 
+def parse_subscriber_ids(content):
+    """Return the set of IDs in an export file, one ID per line"""
+    imported_ids = set()
+    for line in content.decode().splitlines():
+        line = line.strip()
+        if line.isdigit():
+            imported_ids.add(int(line))
+    return imported_ids
+
+
 async def handle_txt_import(update: Update,
                             context: ContextTypes.DEFAULT_TYPE):
     """Handle .txt file import for subscribers (admin only)"""
@@ -3512,27 +5410,19 @@ async def handle_txt_import(update: Update,
     try:
         # Download file
         file = await context.bot.get_file(update.message.document.file_id)
-        file_path = f"temp_subs_import_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        await file.download_to_drive(file_path)
+        content = await file.download_as_bytearray()
 
         # Read subscriber IDs
-        imported_ids = set()
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.isdigit():
-                    imported_ids.add(int(line))
+        imported_ids = await persistence_io.run(parse_subscriber_ids,
+                                                content)
 
         # Merge with existing subscribers
         old_count = len(subscribers)
-        subscribers.update(imported_ids)
+        new_ids = subscribers.update(imported_ids)
         new_count = len(subscribers)
         added_count = new_count - old_count
 
-        save_subscribers()
-
-        # Clean up
-        os.remove(file_path)
+        save_subscribers(added=new_ids)
 
         await update.message.reply_text(
             f"✅ Subscriber import completed!\n\n"
@@ -3563,13 +5453,42 @@ def main():
     async def post_init(app):
         # Load subscriber data
         await load_subscribers()
-        load_top_posts()
-        load_scheduled_messages()
+        await load_top_posts()
+        await load_scheduled_messages()
         await load_channel_link()
         await load_failed_subscribers()
 
-    application = Application.builder().token(BOT_TOKEN).post_init(
-        post_init).build()
+        # Watch for anything that still blocks the event loop
+        app.bot_data["loop_lag_monitor"] = asyncio.create_task(
+            monitor_event_loop_lag())
+
+        # Resume automatic sending where it was before the restart
+        slot_scheduler.job_queue = app.job_queue
+        rehydrate_schedule()
+
+        # Pick up any fan-out that was cut short by a crash or redeploy
+        await persistence_io.run(broadcast_journal.load)
+        if broadcast_journal.records:
+            app.job_queue.run_once(resume_unfinished_broadcasts,
+                                   when=5,
+                                   name="resume_broadcasts")
+
+    async def post_shutdown(app):
+        app.bot_data["loop_lag_monitor"].cancel()
+
+        # Write whatever the write-behind persistence hasn't saved yet and
+        # wait for the persistence thread to finish it
+        persistence.flush_all()
+        persistence_io.shutdown()
+        storage.close()
+
+    builder = Application.builder().token(BOT_TOKEN)
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    application = builder.rate_limiter(
+        FloodControlLimiter(global_rate_limiter,
+                            broadcast_controller)).post_init(
+                                post_init).post_shutdown(post_shutdown).build()
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
@@ -3606,6 +5525,11 @@ def main():
     # Add callback query handler for inline buttons
     application.add_handler(CallbackQueryHandler(handle_callback_query))
 
+    # Keep the chat cache in step with the bot's own admin rights
+    application.add_handler(
+        ChatMemberHandler(handle_my_chat_member,
+                          ChatMemberHandler.MY_CHAT_MEMBER))
+
     # Document handler for .txt imports
     application.add_handler(
         MessageHandler(filters.Document.ALL, handle_txt_import))
@@ -3619,43 +5543,6 @@ def main():
     application.add_handler(
         MessageHandler(filters.ALL, fallback_message_handler))
 
-    # Schedule the automatic /send command every odd hour
-    current_time = datetime.now(cairo_tz)
-    next_odd_hour = (current_time.hour // 2 * 2 + 1) % 24
-
-    if next_odd_hour <= current_time.hour:
-        next_send_time = current_time.replace(
-            hour=next_odd_hour, minute=0, second=0,
-            microsecond=0) + timedelta(days=1)
-    else:
-        next_send_time = current_time.replace(hour=next_odd_hour,
-                                              minute=0,
-                                              second=0,
-                                              microsecond=0)
-
-    delay = (next_send_time - current_time).total_seconds()
-
-    application.job_queue.run_once(trigger_send_command,
-                                   when=delay,
-                                   name="auto_send_command")
-
-    # Add periodic save job to ensure data persistence
-    async def periodic_save(context):
-        """Periodically save subscribers and other data"""
-        try:
-            save_subscribers()
-            save_top_posts()
-            save_scheduled_messages()
-            logging.info("Periodic save completed")
-        except Exception as e:
-            logging.error(f"Periodic save failed: {e}")
-
-    # Save every 5 minutes
-    application.job_queue.run_repeating(periodic_save,
-                                        interval=300,
-                                        first=60,
-                                        name="periodic_save")
-
     # Start the bot
     application.run_polling()
 
@@ -0,0 +1,339 @@
+"""Upgrade or convert the bot's stored state offline
+
+Run it from the bot's working directory while the bot is stopped:
+
+    python migrate_state.py upgrade
+    python migrate_state.py to-sqlite --db bot_state.db
+    python migrate_state.py to-json --db bot_state.db
+
+upgrade rewrites every JSON state file at the current schema version.
+to-sqlite and to-json copy the state between the JSON files and a SQLite
+database, for switching STORAGE_BACKEND. The subscriber and failure lists
+are streamed record by record, so a deployment with millions of subscribers
+is converted without holding them all in memory. The bot upgrades old files
+itself as it loads them; this tool does the same work ahead of time.
+channel_link.txt is plain text and needs no migration.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+# Importing main opens the configured storage backend, which for sqlite
+# would import the JSON files into the default database as a side effect
+os.environ["STORAGE_BACKEND"] = "json"
+
+import main as bot
+
+# Datasets that are stored in both backends
+DATASETS = (bot.SUBSCRIBERS_FILE, bot.FAILED_SUBSCRIBERS_FILE,
+            bot.SCHEDULED_MESSAGES_FILE, bot.TOP_POSTS_FILE,
+            bot.COLLECTED_POSTS_FILE, bot.SENT_POSTS_TRACKING_FILE,
+            bot.DAILY_ANALYTICS_FILE)
+
+# Streamed records are written to SQLite in batches of this many
+BATCH_SIZE = 10000
+
+
+class JSONMemberReader:
+    """Reads a JSON object from a text file one member at a time
+
+    events() yields ("value", key, value) for scalar members. Array and
+    object members are not decoded whole: they come as ("start", key, "[")
+    or ("start", key, "{"), then one ("item", key, element) per array
+    element or ("entry", key, (name, value)) per object entry, then
+    ("end", key, "]") or ("end", key, "}").
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, '' at the end"""
+        while True:
+            while (self.pos < len(self.buffer)
+                   and self.buffer[self.pos] in " \t\r\n"):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(
+                f"Expected one of {chars!r} but found {char or 'end of file'!r}"
+            )
+        self.pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # The value runs past the end of the buffer
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the end of the buffer still decodes, as a
+            # shorter one ("12" of "125", "-1" of "-1.5"), so it only counts
+            # once a delimiter follows it
+            cut_off = (end == len(self.buffer)
+                       or self.buffer[end] not in ",]} \t\r\n")
+            if (isinstance(value, (int, float)) and cut_off and not self.eof
+                    and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+    def events(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            opener = self._peek()
+            if opener in ("[", "{"):
+                self.pos += 1
+                closer = "]" if opener == "[" else "}"
+                yield "start", key, opener
+                if self._peek() == closer:
+                    self.pos += 1
+                else:
+                    while True:
+                        if opener == "[":
+                            yield "item", key, self._value()
+                        else:
+                            name = self._value()
+                            self._expect(":")
+                            yield "entry", key, (name, self._value())
+                        if self._expect("," + closer) == closer:
+                            break
+                yield "end", key, closer
+            else:
+                yield "value", key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+def newest_valid_snapshot(path):
+    """Return the newest generation of path whose checksum matches
+
+    None if the dataset was never saved; an error if it was but no
+    generation is intact, rather than migrating it as empty.
+    """
+    found = False
+    for generation in range(bot.SNAPSHOT_GENERATIONS):
+        candidate = bot.snapshot_generation(path, generation)
+        if not os.path.exists(candidate):
+            continue
+        found = True
+        if os.path.exists(f"{candidate}.sha256"):
+            digest = hashlib.sha256()
+            with open(candidate, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            if not bot.snapshot_checksum_matches(candidate,
+                                                 digest.hexdigest()):
+                logging.warning(
+                    f"Skipping {candidate}: checksum does not match")
+                continue
+        return candidate
+    if found:
+        raise ValueError(f"No intact snapshot of {path}")
+    return None
+
+
+def read_events(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from JSONMemberReader(f).events()
+
+
+def upgraded_chunks(name, events):
+    """Re-encode a document's events as JSON byte chunks at the current version"""
+    records_key = bot.UPGRADED_RECORDS.get(name)
+    separator = b""
+    yield b"{"
+    for kind, key, value in events:
+        if kind == "value":
+            if key == "schema_version":
+                if value > bot.STATE_SCHEMA_VERSION:
+                    raise ValueError(
+                        f"{name} has schema version {value}, newer than {bot.STATE_SCHEMA_VERSION}"
+                    )
+                continue
+            yield separator + bot.encode_json(key) + b":" + bot.encode_json(
+                value)
+            separator = b","
+        elif kind == "start":
+            yield separator + bot.encode_json(key) + b":" + value.encode()
+            separator = b","
+            item_separator = b""
+        elif kind == "item":
+            if key == records_key and isinstance(value, dict):
+                bot.upgrade_record(name, value)
+            yield item_separator + bot.encode_json(value)
+            item_separator = b","
+        elif kind == "entry":
+            entry_name, entry_value = value
+            yield item_separator + bot.encode_json(
+                str(entry_name)) + b":" + bot.encode_json(entry_value)
+            item_separator = b","
+        else:
+            yield value.encode()
+    yield separator + b'"schema_version":' + str(
+        bot.STATE_SCHEMA_VERSION).encode() + b"}"
+
+
+def streamed_records(events, kind):
+    for event, _, value in events:
+        if event == kind:
+            yield value
+
+
+def batches(iterable, size=BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upgrade():
+    for name in DATASETS + (bot.BROADCAST_JOURNAL_FILE, ):
+        try:
+            path = newest_valid_snapshot(name)
+            if path is None:
+                continue
+            bot.write_snapshot_stream(
+                name, upgraded_chunks(name, read_events(path)))
+            logging.info(f"Upgraded {name} from {path}")
+        except Exception as e:
+            logging.error(f"Failed to upgrade {name}: {e}")
+            return False
+    return True
+
+
+def to_sqlite(db_path):
+    db = bot.SQLiteStorage(db_path)
+    source = bot.JSONStorage()
+    try:
+        for name in DATASETS:
+            path = newest_valid_snapshot(name)
+            if name == bot.SUBSCRIBERS_FILE:
+                user_ids = streamed_records(read_events(path),
+                                            "item") if path else ()
+                db.save(name, {"user_ids": user_ids})
+                # Changes logged since the last snapshot, replayed in order
+                if os.path.exists(bot.SUBSCRIBERS_LOG_FILE):
+                    for op, user_id in bot.read_subscriber_log():
+                        if op == "+":
+                            db.add_subscribers((user_id, ))
+                        elif op == "-":
+                            db.remove_subscribers((user_id, ))
+            elif name == bot.FAILED_SUBSCRIBERS_FILE:
+                db.save(name, {"failed_subscribers": {}})
+                if path:
+                    entries = streamed_records(read_events(path), "entry")
+                    for batch in batches(entries):
+                        db.set_failures(dict(batch))
+            else:
+                data = source.load(name)
+                if data is None:
+                    continue
+                db.save(name, data)
+            logging.info(f"Copied {name} into {db_path}")
+        db.mark_imported()
+    except Exception as e:
+        logging.error(f"Failed to copy the JSON state into {db_path}: {e}")
+        return False
+    finally:
+        db.close()
+    return True
+
+
+def failure_chunks(entries):
+    separator = b""
+    yield b'{"failed_subscribers":{'
+    for user_id, failures in entries:
+        yield separator + bot.encode_json(str(user_id)) + b":" + str(
+            failures).encode()
+        separator = b","
+    yield b'},"schema_version":' + str(
+        bot.STATE_SCHEMA_VERSION).encode() + b"}"
+
+
+def to_json(db_path):
+    if not os.path.exists(db_path):
+        logging.error(f"{db_path} does not exist")
+        return False
+    db = bot.SQLiteStorage(db_path)
+    target = bot.JSONStorage()
+    try:
+        for name in DATASETS:
+            if name == bot.SUBSCRIBERS_FILE:
+                # JSONStorage streams the IDs and clears the subscriber log
+                target.save(name, {"user_ids": db.iter_subscribers()})
+            elif name == bot.FAILED_SUBSCRIBERS_FILE:
+                bot.write_snapshot_stream(name,
+                                          failure_chunks(db.iter_failures()))
+            else:
+                data = db.load(name)
+                if data is None:
+                    continue
+                target.save(name, data)
+            logging.info(f"Copied {name} out of {db_path}")
+    except Exception as e:
+        logging.error(f"Failed to copy {db_path} into JSON files: {e}")
+        return False
+    finally:
+        db.close()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("upgrade",
+                        help="rewrite the JSON files at the current version")
+    for command, help_text in (("to-sqlite", "copy the JSON files into --db"),
+                               ("to-json", "copy --db into the JSON files")):
+        subparser = commands.add_parser(command, help=help_text)
+        subparser.add_argument("--db", default=bot.STORAGE_DB_FILE)
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        ok = upgrade()
+    elif args.command == "to-sqlite":
+        ok = to_sqlite(args.db)
+    else:
+        ok = to_json(args.db)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# main.py logs to bot.log and reads its state files from the working
+# directory on import, so import it from an empty one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="bot-tests-"))
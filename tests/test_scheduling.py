@@ -0,0 +1,273 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from main import ScheduledMessage, ScheduledQueue, SlotCalendar, SlotScheduler, cairo_tz
+
+
+def at(day, hour=0, minute=0):
+    """Cairo time on the given day of October 2026 (the 19th is a Monday)"""
+    return cairo_tz.localize(datetime(2026, 10, day, hour, minute))
+
+
+def take(calendar, count, now):
+    return [calendar.slot(position, now) for position in range(count)]
+
+
+# SlotCalendar
+
+
+def test_slots_follow_hours_from_now():
+    calendar = SlotCalendar([21, 9, 13, 9])
+    assert take(calendar, 4, at(19, 10)) == [
+        at(19, 13), at(19, 21), at(20, 9), at(20, 13)
+    ]
+
+
+def test_weekday_hours_override_the_default_hours():
+    # Saturday the 24th only sends at 10
+    calendar = SlotCalendar([9, 21], weekday_hours={5: [10]})
+    assert take(calendar, 4, at(23, 22)) == [
+        at(24, 10), at(25, 9), at(25, 21), at(26, 9)
+    ]
+
+
+def test_calendar_without_any_hours_is_refused():
+    with pytest.raises(ValueError):
+        SlotCalendar([], weekday_hours={weekday: [] for weekday in range(7)})
+
+
+def test_overlapping_blackouts_are_merged():
+    calendar = SlotCalendar([9, 13, 21],
+                            blackouts=[(at(20, 12), at(20, 22)),
+                                       (at(19, 8), at(19, 10)),
+                                       (at(20, 8), at(20, 14))])
+    assert calendar._blackout_starts == [at(19, 8), at(20, 8)]
+    assert calendar._blackout_ends == [at(19, 10), at(20, 22)]
+    assert take(calendar, 4, at(19, 0)) == [
+        at(19, 13), at(19, 21), at(21, 9), at(21, 13)
+    ]
+
+
+def test_blackout_end_is_exclusive():
+    calendar = SlotCalendar([9, 13], blackouts=[(at(19, 9), at(19, 13))])
+    assert take(calendar, 2, at(19, 0)) == [at(19, 13), at(20, 9)]
+
+
+def test_slots_are_cached_and_passed_ones_dropped():
+    calendar = SlotCalendar([9, 13, 21])
+    assert calendar.slot(3, at(19, 0)) == at(20, 9)
+    upcoming = calendar._upcoming
+    # Two slots have passed since; the cache shifts rather than restarts
+    assert calendar.slot(0, at(19, 14)) == at(19, 21)
+    assert calendar._slots == [at(19, 21), at(20, 9)]
+    assert calendar._upcoming is upcoming
+    assert calendar.slot(2, at(19, 14)) == at(20, 13)
+
+
+def test_cache_restarts_once_every_slot_has_passed():
+    calendar = SlotCalendar([9])
+    assert calendar.slot(0, at(19, 0)) == at(19, 9)
+    assert calendar.slot(0, at(22, 12)) == at(23, 9)
+
+
+def test_slot_after():
+    calendar = SlotCalendar([9, 13, 21])
+    first = calendar.slot(0)
+    assert calendar.slot_after(first) == calendar.slot(1)
+    assert calendar.slot_after(first - timedelta(minutes=1)) == first
+    assert calendar.slot_after(calendar.slot(2)) == calendar.slot(3)
+    # A send time long gone still moves to an upcoming slot
+    assert calendar.slot_after(first - timedelta(days=3)) == first
+
+
+def test_channels_for_respects_channel_hours():
+    calendar = SlotCalendar([9, 13, 21], channel_hours={1: {9, 21}})
+    assert calendar.channels_for(at(19, 9), [1, 2]) == [1, 2]
+    assert calendar.channels_for(at(19, 13), [1, 2]) == [2]
+    assert calendar.channels_for(None, [1, 2]) == [1, 2]
+
+
+def test_channels_for_uses_cairo_hours():
+    calendar = SlotCalendar([9, 13], channel_hours={1: {13}})
+    utc_slot = at(19, 13).astimezone(main.pytz.utc)
+    assert calendar.channels_for(utc_slot, [1]) == [1]
+
+
+def test_slots_no_target_channel_posts_at_are_skipped():
+    channels = {1}
+    calendar = SlotCalendar([9, 13, 21],
+                            channel_hours={1: [13]},
+                            channels=channels)
+    assert take(calendar, 2, at(19, 0)) == [at(19, 13), at(20, 13)]
+
+    # A channel without its own hours posts at every slot
+    channels.add(2)
+    calendar.channels_changed()
+    assert take(calendar, 2, at(19, 0)) == [at(19, 9), at(19, 13)]
+    assert calendar.version == 1
+
+
+def test_channel_hours_outside_the_calendar_are_ignored():
+    calendar = SlotCalendar([9, 13], channel_hours={1: [3]}, channels={1})
+    assert take(calendar, 2, at(19, 0)) == [at(19, 9), at(19, 13)]
+
+
+# SlotScheduler
+
+
+class FakeJob:
+
+    def __init__(self, when):
+        self.when = when
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, name):
+        self.jobs.append(FakeJob(when))
+        return self.jobs[-1]
+
+
+def test_scheduler_returns_the_earliest_live_send():
+    scheduler = SlotScheduler()
+    scheduler.schedule("a", at(19, 13))
+    scheduler.schedule("b", at(19, 9))
+    scheduler.schedule("c", at(19, 21))
+    assert len(scheduler) == 3 and "b" in scheduler
+    assert scheduler._next() == (at(19, 9), "b")
+    assert scheduler.latest() == at(19, 21)
+
+    scheduler.cancel("b")
+    assert "b" not in scheduler
+    assert scheduler._next() == (at(19, 13), "a")
+
+    # Moving a message leaves its old entry behind to be skipped
+    scheduler.schedule("a", at(20, 9))
+    assert scheduler._next() == (at(19, 21), "c")
+    assert scheduler.latest() == at(20, 9)
+
+    scheduler.cancel("missing")
+    assert len(scheduler) == 2
+
+
+def test_scheduler_rebuilds_a_mostly_stale_heap():
+    scheduler = SlotScheduler()
+    for number in range(200):
+        scheduler.schedule(number, at(19, 0) + timedelta(minutes=number))
+    for number in range(199):
+        scheduler.cancel(number)
+    assert len(scheduler._heap) <= 2 * len(scheduler) + 64
+    assert scheduler._next() == (at(19, 0) + timedelta(minutes=199), 199)
+
+
+def test_scheduler_arms_one_job_for_the_earliest_send():
+    scheduler = SlotScheduler()
+    scheduler.job_queue = FakeJobQueue()
+    later = datetime.now(cairo_tz) + timedelta(hours=2)
+    scheduler.schedule("a", later)
+    scheduler.schedule("b", later + timedelta(hours=1))
+    assert len(scheduler.job_queue.jobs) == 1
+
+    # An earlier send replaces the armed job
+    scheduler.schedule("c", later - timedelta(hours=1))
+    first, second = scheduler.job_queue.jobs
+    assert first.removed and not second.removed
+    assert second.when < first.when
+
+    scheduler.clear()
+    assert second.removed and len(scheduler) == 0
+
+
+def test_scheduler_tells_its_watcher_of_moves():
+
+    class Watcher:
+
+        def __init__(self):
+            self.moved = []
+
+        def rescheduled(self, message_id):
+            self.moved.append(message_id)
+
+    scheduler = SlotScheduler(watcher=Watcher())
+    scheduler.schedule("a", at(19, 9))
+    scheduler.schedule("a", at(19, 13))
+    assert scheduler.watcher.moved == ["a", "a"]
+
+
+# ScheduledQueue
+
+
+def make_messages(count):
+    return [ScheduledMessage(message_id=f"m{number}") for number in range(count)]
+
+
+def ids(queue):
+    return [msg.id for msg in queue]
+
+
+def test_queue_appends_and_indexes_by_id():
+    messages = make_messages(3)
+    queue = ScheduledQueue(messages)
+    assert ids(queue) == ["m0", "m1", "m2"]
+    assert queue.get("m1") is messages[1]
+    assert queue.index(messages[2]) == 2
+    assert [sequence for sequence, _ in queue.items()] == [0, 1, 2]
+    with pytest.raises(ValueError):
+        queue.append(messages[0])
+
+
+def test_front_insert_keeps_other_sequences():
+    messages = make_messages(3)
+    queue = ScheduledQueue(messages[1:])
+    queue.insert(0, messages[0])
+    assert ids(queue) == ["m0", "m1", "m2"]
+    assert [sequence for sequence, _ in queue.items()] == [-1, 0, 1]
+    assert queue.index(messages[0]) == 0
+
+
+def test_middle_insert_renumbers_the_queue():
+    messages = make_messages(4)
+    queue = ScheduledQueue([messages[0], messages[1], messages[3]])
+    queue.insert(0, ScheduledMessage(message_id="front"))
+    queue.insert(3, messages[2])
+    assert ids(queue) == ["front", "m0", "m1", "m2", "m3"]
+    assert [sequence for sequence, _ in queue.items()] == [0, 1, 2, 3, 4]
+    assert [queue.index(msg) for msg in messages] == [1, 2, 3, 4]
+
+
+def test_insert_past_the_end_appends():
+    messages = make_messages(2)
+    queue = ScheduledQueue(messages[:1])
+    queue.insert(5, messages[1])
+    assert ids(queue) == ["m0", "m1"]
+
+
+def test_saved_sequences_are_kept():
+    messages = make_messages(3)
+    queue = ScheduledQueue(messages, sequences=[7, -2, 3])
+    assert ids(queue) == ["m1", "m2", "m0"]
+    assert [sequence for sequence, _ in queue.items()] == [-2, 3, 7]
+    queue.append(ScheduledMessage(message_id="last"))
+    assert list(queue.items())[-1][0] == 8
+
+
+def test_remove_and_pop():
+    messages = make_messages(4)
+    queue = ScheduledQueue(messages)
+    queue.remove(messages[1])
+    assert ids(queue) == ["m0", "m2", "m3"]
+    assert messages[1] not in queue
+    assert queue.pop(0) is messages[0]
+    assert queue.pop() is messages[3]
+    assert ids(queue) == ["m2"]
+    with pytest.raises(ValueError):
+        queue.remove(messages[0])